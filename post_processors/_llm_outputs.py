@@ -0,0 +1,61 @@
+"""
+Shared discovery and reading of the LLM output CSVs used by the snapshot sheet post-processors
+"""
+import csv
+import os
+import re
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    _CSV_ENGINE = 'pyarrow'
+except ImportError:
+    _CSV_ENGINE = 'c'
+
+# Output folders already created in this process
+_ensured_dirs = set()
+
+# {prompt}_{dept_key}_{mm}_{dd}.csv, e.g. threatening_mv_resolvers_07_28.csv
+_LLM_OUTPUT_RE = re.compile(
+    r'^(saprompt|threatening|unnecessary_clinic_rec|call_request)_(.+)_(\d\d)_(\d\d)\.csv$')
+
+
+def scan_llm_outputs(date_folder, mm_dd):
+    """Index a date folder's LLM output CSVs for mm_dd as {(prompt, dept_key): (filepath, filename)}.
+
+    The folder is read once with os.scandir; a missing folder gives an empty index.
+    """
+    outputs = {}
+    try:
+        with os.scandir(f"outputs/LLM_outputs/{date_folder}") as entries:
+            for entry in entries:
+                match = _LLM_OUTPUT_RE.match(entry.name)
+                if match and f"{match.group(3)}_{match.group(4)}" == mm_dd:
+                    outputs[(match.group(1), match.group(2))] = (entry.path, entry.name)
+    except FileNotFoundError:
+        pass
+    return outputs
+
+
+def ensure_output_dir(path):
+    """Create an output folder once per process; later calls for the same folder skip the filesystem"""
+    if path not in _ensured_dirs:
+        os.makedirs(path, exist_ok=True)
+        _ensured_dirs.add(path)
+
+
+def read_llm_output_column(filepath):
+    """Read only the llm_output column of an LLM output CSV as a string Series (None if the column is missing)"""
+    with open(filepath, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f), [])
+    if 'llm_output' not in header:
+        return None
+    
+    if _CSV_ENGINE == 'pyarrow':
+        # Keep the column Arrow-backed so the callers' .str methods run on Arrow compute kernels
+        df = pd.read_csv(filepath, engine='pyarrow', usecols=['llm_output'], dtype={'llm_output': 'string[pyarrow]'})
+    else:
+        # Parse straight from the page cache instead of copying the file through a read buffer
+        df = pd.read_csv(filepath, usecols=['llm_output'], dtype={'llm_output': 'string'}, memory_map=True)
+    return df['llm_output']
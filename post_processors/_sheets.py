@@ -0,0 +1,273 @@
+"""
+Shared Google Sheets API client for the snapshot sheet post-processors
+"""
+import json
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+from string import ascii_uppercase
+
+import httplib2
+from google.oauth2.service_account import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.model import JsonModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+
+# Snapshot Google Spreadsheet ID of each department
+DEPARTMENT_SHEETS = {
+    'Doctors': '1STHimb0IJ077iuBtTOwsa-GD8jStjU3SiBW7yBWom-E',
+    'Delighters': '1PV0ZmobUYKHGZvHC7IfJ1t6HrJMTFi6YRbpISCouIfQ',
+    'CC Sales': '1te1fbAXhURIUO0EzQ2Mrorv3a6GDtEVM_5np9TO775o',
+    'CC Resolvers': '1QdmaTc5F2VUJ0Yu0kNF9d6ETnkMOlOgi18P7XlBSyHg',  # CC Department
+    'Filipina': '1E5wHZKSDXQZlHIb3sV4ZWqIxvboLduzUEU0eupK7tys',
+    'African': '1__KlrVjcpR8RoYfTYMYZ_EgddUSXMhK3bJO0fTGwDig',
+    'Ethiopian': '1ENzdgiwUEtBSb5sHZJWs5aG8g2H62Low8doaDZf8s90',
+    'MV Resolvers': '1XkVcHlkh8fEp7mmBD1Zkavdp2blBLwSABT1dE_sOf74',
+    'MV Sales': '1agrl9hlBhemXkiojuWKbqiMHKUzxGgos4JSkXxw7NAk'
+}
+
+# Display name of each department, keyed like the LLM output filenames (cc_sales -> CC Sales)
+DEPARTMENT_NAMES = {department.lower().replace(' ', '_'): department for department in DEPARTMENT_SHEETS}
+
+# A1 column letters by 0-based column index (A..Z, AA..ZZ), so lookups need no chr/ord arithmetic
+COLUMN_LETTERS = list(ascii_uppercase) + [first + second for first in ascii_uppercase for second in ascii_uppercase]
+
+# Seconds before a stalled Sheets request gives up
+HTTP_TIMEOUT = 30
+
+# Rate-limit and transient server errors worth retrying, with exponential backoff between attempts
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_ATTEMPTS = 5
+RETRY_MIN_WAIT = 2  # seconds
+RETRY_MAX_WAIT = 30  # seconds
+
+# Dates are appended daily, so only this many rows at the bottom of column A are read (over a year)
+DATE_SCAN_ROWS = 400
+
+# spreadsheets.get fields mask returning each tab's title and row count
+TAB_FIELDS = 'sheets.properties(title,gridProperties.rowCount)'
+
+# values.batchGet / values.batchUpdate fields masks: keep only the cell values read, and one
+# count from the write responses (each range stays in the reply so positions line up)
+VALUES_FIELDS = 'valueRanges(range,values)'
+UPDATE_FIELDS = 'totalUpdatedCells'
+
+# Column and date-row lookups persisted across runs; each entry expires a day after it was stored
+LOOKUP_CACHE_PATH = 'outputs/.cache/sheet_lookups.json'
+LOOKUP_CACHE_TTL = 24 * 3600  # seconds
+
+_lookup_lock = threading.Lock()
+_lookups = None
+
+# httplib2 connections are not thread-safe, so each thread keeps its own per credentials
+_thread_local = threading.local()
+
+
+def _thread_http(credentials):
+    """Get the calling thread's persistent authorized connection for these credentials"""
+    connections = getattr(_thread_local, 'connections', None)
+    if connections is None:
+        connections = _thread_local.connections = {}
+    http = connections.get(credentials)
+    if http is None:
+        http = connections[credentials] = AuthorizedHttp(
+            credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    return http
+
+
+class _OrjsonModel(JsonModel):
+    """JsonModel that serializes request bodies with orjson, far faster than json.dumps on large uploads"""
+
+    def serialize(self, body_value):
+        if isinstance(body_value, dict) and 'data' not in body_value and self._data_wrapper:
+            body_value = {'data': body_value}
+        return orjson.dumps(body_value).decode('utf-8')
+
+
+@lru_cache(maxsize=None)
+def get_credentials(credentials_path='credentials.json'):
+    """Load the service account credentials once per credentials file"""
+    return Credentials.from_service_account_file(credentials_path, scopes=SCOPES)
+
+
+@lru_cache(maxsize=None)
+def get_sheets_service(credentials_path='credentials.json'):
+    """Build the Sheets service once per credentials file on a persistent keep-alive connection.
+    
+    The discovery document comes from the copy bundled with google-api-python-client, not over HTTP,
+    and request bodies are serialized with orjson when it is installed.
+    """
+    creds = get_credentials(credentials_path)
+    return build('sheets', 'v4', http=_thread_http(creds), cache_discovery=False, static_discovery=True,
+                 model=_OrjsonModel() if orjson else None)
+
+
+def index_to_column_letter(index):
+    """Convert a 0-based column index to its A1 letters (0=A, 25=Z, 26=AA, 702=AAA)"""
+    if index < len(COLUMN_LETTERS):
+        return COLUMN_LETTERS[index]
+    # Past ZZ, build the letters from the same alphabet with divmod
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = ascii_uppercase[remainder] + letters
+    return letters
+
+
+def column_letter_to_index(letters):
+    """Convert A1 column letters to a 0-based column index (A=0, Z=25, AA=26)"""
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def tab_row_counts(spreadsheet):
+    """Map each tab title of a spreadsheets.get(fields=TAB_FIELDS) response to its row count"""
+    return {
+        sheet['properties']['title']: sheet['properties'].get('gridProperties', {}).get('rowCount', 0)
+        for sheet in spreadsheet.get('sheets', [])
+    }
+
+
+def date_scan_range(sheet_name, row_count):
+    """Return (range, first_row) covering the last DATE_SCAN_ROWS rows of a tab's column A"""
+    first_row = max(1, row_count - DATE_SCAN_ROWS + 1)
+    return f"{sheet_name}!A{first_row}:A{max(row_count, 1)}", first_row
+
+
+def sheet_context_request(service, spreadsheet_id, sheet_name, row_count):
+    """Build the batchGet request for a sheet's header row and the tail of its column A"""
+    return service.spreadsheets().values().batchGet(
+        spreadsheetId=spreadsheet_id,
+        ranges=[f"{sheet_name}!1:1", date_scan_range(sheet_name, row_count)[0]],
+        majorDimension='ROWS',
+        fields=VALUES_FIELDS
+    )
+
+
+def parse_sheet_context(result, first_row):
+    """Split a header row + column A tail batchGet response into a context dict"""
+    header_range, column_a_range = result.get('valueRanges', [{}, {}])
+    return {
+        'header_row': header_range.get('values', [[]])[0],
+        'column_a': column_a_range.get('values', []),
+        'column_a_first_row': first_row  # Google Sheets is 1-indexed
+    }
+
+
+def fetch_sheet_context(service, spreadsheet_id, sheet_name, row_counts=None):
+    """Fetch a sheet's header row and the tail of its column A; None if the spreadsheet has no such tab.
+    
+    row_counts is the spreadsheet's tab_row_counts() if already read.
+    """
+    if row_counts is None:
+        row_counts = tab_row_counts(execute(service.spreadsheets().get(spreadsheetId=spreadsheet_id,
+                                                                        fields=TAB_FIELDS)))
+    # The row count bounds the column A read to the rows where recent dates live
+    row_count = row_counts.get(sheet_name)
+    if row_count is None:
+        return None
+    result = execute(sheet_context_request(service, spreadsheet_id, sheet_name, row_count))
+    return parse_sheet_context(result, date_scan_range(sheet_name, row_count)[1])
+
+
+def load_full_column_a(service, spreadsheet_id, sheet_name, context):
+    """Replace a sheet context's column A tail with the whole column; returns False if it already had it.
+    
+    The tail window is sized from the grid row count, which includes blank rows below the data,
+    so a date missing from the tail may still be further up the sheet.
+    """
+    if context.get('column_a_first_row', 1) == 1:
+        return False
+    result = execute(service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id, range=f"{sheet_name}!A:A", majorDimension='ROWS', fields='values'))
+    context['column_a'] = result.get('values', [])
+    context['column_a_first_row'] = 1
+    return True
+
+
+def _retry_delay(error, attempt):
+    """Seconds to wait before retrying: the server's Retry-After if given, else jittered exponential backoff"""
+    retry_after = error.resp.get('retry-after')
+    if retry_after:
+        try:
+            return min(float(retry_after), RETRY_MAX_WAIT)
+        except ValueError:
+            pass
+    return random.uniform(RETRY_MIN_WAIT, min(RETRY_MAX_WAIT, RETRY_MIN_WAIT * 2 ** attempt))
+
+
+def _with_retry(call):
+    """Run a Sheets API call, retrying rate-limit (429) and 5xx errors before giving up"""
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            return call()
+        except HttpError as e:
+            if e.resp.status not in RETRY_STATUSES or attempt == RETRY_ATTEMPTS - 1:
+                raise
+            delay = _retry_delay(e, attempt)
+            print(f"⏳ Sheets API returned {e.resp.status}, retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 2}/{RETRY_ATTEMPTS})")
+            time.sleep(delay)
+
+
+def execute(request):
+    """Execute a Sheets API request on the calling thread's own connection (safe from worker threads)"""
+    return _with_retry(lambda: request.execute(http=_thread_http(request.http.credentials)))
+
+
+def execute_batch(batch, credentials_path='credentials.json'):
+    """Send a BatchHttpRequest (many API calls in one multipart HTTP request) on the calling thread's connection.
+    
+    Only a failure of the whole batch is retried; per-request errors go to the batch callback.
+    """
+    _with_retry(lambda: batch.execute(http=_thread_http(get_credentials(credentials_path))))
+
+
+def _load_lookups():
+    """Load the persisted lookups once per process (caller holds _lookup_lock)"""
+    global _lookups
+    if _lookups is None:
+        try:
+            with open(LOOKUP_CACHE_PATH) as f:
+                _lookups = json.load(f)
+        except (OSError, ValueError):
+            _lookups = {}
+    return _lookups
+
+
+def get_cached_lookup(*key):
+    """Return the value stored for a lookup key (e.g. 'column', sheet_id, header) if it has not expired"""
+    with _lookup_lock:
+        entry = _load_lookups().get('|'.join(key))
+    if entry and time.time() - entry['stored_at'] < LOOKUP_CACHE_TTL:
+        return entry['value']
+    return None
+
+
+def remember_lookup(value, *key):
+    """Store a lookup value (e.g. [column, sheet_name]) and persist the cache, dropping expired entries"""
+    with _lookup_lock:
+        lookups = _load_lookups()
+        now = time.time()
+        for stale_key in [k for k, entry in lookups.items() if now - entry['stored_at'] >= LOOKUP_CACHE_TTL]:
+            del lookups[stale_key]
+        lookups['|'.join(key)] = {'value': value, 'stored_at': now}
+        try:
+            os.makedirs(os.path.dirname(LOOKUP_CACHE_PATH), exist_ok=True)
+            with open(LOOKUP_CACHE_PATH, 'w') as f:
+                json.dump(lookups, f)
+        except OSError as e:
+            print(f"⚠️ Could not save sheet lookup cache: {str(e)}")
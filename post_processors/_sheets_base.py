@@ -0,0 +1,370 @@
+"""
+Shared base class for the post-processors that write daily metrics into the department snapshot sheets
+"""
+import os
+import threading
+
+from post_processors._sheets import (TAB_FIELDS, UPDATE_FIELDS, column_letter_to_index, date_scan_range, execute,
+                                     execute_batch, fetch_sheet_context, get_cached_lookup, get_sheets_service,
+                                     index_to_column_letter, load_full_column_a, parse_sheet_context,
+                                     remember_lookup, sheet_context_request, tab_row_counts)
+
+# Tabs that may hold a snapshot sheet's data, in the order they are tried
+SNAPSHOT_TABS = ('Data', 'Sheet1', 'Main')
+
+
+class SnapshotSheetProcessor:
+    """Finds a metric's column and yesterday's row in a snapshot sheet and queues the cell updates.
+    
+    Subclasses either set snapshot_sheet_id or pass sheet_id to each call, and call flush_writes()
+    once their updates are queued so each spreadsheet gets a single values.batchUpdate. Sheets whose
+    data may sit in any of several tabs use find_header_column() and find_date_in_tabs().
+    """
+
+    def __init__(self, credentials_path='credentials.json'):
+        """Set up the Sheets API connection and the per-run sheet caches"""
+        self.credentials_path = credentials_path
+        self.service = None
+        self.setup_sheets_api()
+        
+        # Header row and the tail of column A, keyed by (spreadsheet ID, sheet name)
+        self._sheet_context = {}
+        
+        # Row count of each tab, keyed by spreadsheet ID
+        self._tab_row_counts = {}
+        
+        # Cell updates waiting to be written by flush_writes(), keyed by spreadsheet ID
+        self._pending_writes = {}
+        self._pending_lock = threading.Lock()
+    
+    def setup_sheets_api(self):
+        """Setup Google Sheets API connection"""
+        try:
+            if os.path.exists(self.credentials_path):
+                # Shared with the other snapshot processors so they reuse one connection
+                self.service = get_sheets_service(self.credentials_path)
+                print("✅ Google Sheets API initialized successfully")
+            else:
+                print(f"❌ Credentials file not found: {self.credentials_path}")
+                
+        except Exception as e:
+            print(f"❌ Error setting up Google Sheets API: {str(e)}")
+            self.service = None
+
+    def index_to_column_letter(self, index):
+        """Convert 0-based column index to Google Sheets column letter (A, B, ..., Z, AA, AB, ...)"""
+        return index_to_column_letter(index)
+
+    def _tabs_request(self, spreadsheet_id):
+        """Build the spreadsheets.get request for a spreadsheet's tab titles and row counts"""
+        return self.service.spreadsheets().get(spreadsheetId=spreadsheet_id, fields=TAB_FIELDS)
+
+    def tab_row_counts(self, spreadsheet_id):
+        """Row count of each tab of a spreadsheet (read once per spreadsheet)"""
+        if spreadsheet_id not in self._tab_row_counts:
+            self._tab_row_counts[spreadsheet_id] = tab_row_counts(execute(self._tabs_request(spreadsheet_id)))
+        return self._tab_row_counts[spreadsheet_id]
+
+    def fetch_sheet_context(self, spreadsheet_id, sheet_name='Data'):
+        """Fetch the header row and the tail of column A of a sheet in one batchGet (cached per sheet)"""
+        key = (spreadsheet_id, sheet_name)
+        if key not in self._sheet_context:
+            context = fetch_sheet_context(self.service, spreadsheet_id, sheet_name,
+                                          self.tab_row_counts(spreadsheet_id))
+            if context is None:
+                print(f"⚠️ Sheet '{sheet_name}' not found in spreadsheet {spreadsheet_id}")
+                context = {'header_row': [], 'column_a': [], 'column_a_first_row': 1}
+            self._sheet_context[key] = context
+        return self._sheet_context[key]
+
+    def prefetch_sheet_contexts(self, spreadsheet_ids, sheet_names=('Data',)):
+        """Fetch the context of many sheets with two batch HTTP requests instead of two requests per sheet.
+        
+        Every tab in sheet_names that exists in a spreadsheet is read. Sheets whose requests fail are
+        left uncached, so fetch_sheet_context() retries them individually.
+        """
+        spreadsheet_ids = [spreadsheet_id for spreadsheet_id in dict.fromkeys(spreadsheet_ids)
+                           if any((spreadsheet_id, name) not in self._sheet_context for name in sheet_names)]
+        if not spreadsheet_ids:
+            return
+        
+        def collect(responses):
+            def on_response(request_id, response, exception):
+                if exception is None:
+                    responses[request_id] = response
+            return on_response
+        
+        try:
+            # 1. Row count of each tab in the spreadsheets not read yet
+            spreadsheets = {}
+            unread_ids = [spreadsheet_id for spreadsheet_id in spreadsheet_ids
+                          if spreadsheet_id not in self._tab_row_counts]
+            if unread_ids:
+                batch = self.service.new_batch_http_request(callback=collect(spreadsheets))
+                for spreadsheet_id in unread_ids:
+                    batch.add(self._tabs_request(spreadsheet_id), request_id=spreadsheet_id)
+                execute_batch(batch, self.credentials_path)
+            for spreadsheet_id, spreadsheet in spreadsheets.items():
+                self._tab_row_counts[spreadsheet_id] = tab_row_counts(spreadsheet)
+            
+            # 2. Header row and the tail of column A of the tabs that exist
+            sheets = [(spreadsheet_id, name, self._tab_row_counts[spreadsheet_id][name])
+                      for spreadsheet_id in spreadsheet_ids if spreadsheet_id in self._tab_row_counts
+                      for name in dict.fromkeys(sheet_names)
+                      if name in self._tab_row_counts[spreadsheet_id]
+                      and (spreadsheet_id, name) not in self._sheet_context]
+            results = {}
+            if sheets:
+                batch = self.service.new_batch_http_request(callback=collect(results))
+                for i, (spreadsheet_id, name, row_count) in enumerate(sheets):
+                    batch.add(sheet_context_request(self.service, spreadsheet_id, name, row_count),
+                              request_id=str(i))
+                execute_batch(batch, self.credentials_path)
+            
+            for i, (spreadsheet_id, name, row_count) in enumerate(sheets):
+                if str(i) in results:
+                    first_row = date_scan_range(name, row_count)[1]
+                    self._sheet_context[(spreadsheet_id, name)] = parse_sheet_context(results[str(i)], first_row)
+            
+        except Exception as e:
+            print(f"⚠️ Batch prefetch failed, falling back to per-sheet reads: {str(e)}")
+
+    def find_column_by_name(self, column_name, sheet_name='Data', sheet_id=None):
+        """Find column letter by exact column name with detailed debugging"""
+        try:
+            print(f"🔍 Searching for column '{column_name}' in headers...")
+            
+            # Check if we have a sheet ID to work with
+            if not sheet_id and not hasattr(self, 'snapshot_sheet_id'):
+                print("❌ No snapshot sheet ID configured")
+                return None
+            
+            # Use provided sheet_id or fall back to snapshot_sheet_id
+            spreadsheet_id = sheet_id if sheet_id else self.snapshot_sheet_id
+            
+            # Get the first row (headers)
+            headers = self.fetch_sheet_context(spreadsheet_id, sheet_name)['header_row']
+            
+            # Column positions rarely change, so reuse the one found within the last day
+            # while the header row still has the column there
+            cache_key = ('column', spreadsheet_id, f"{sheet_name}!{column_name}")
+            column_letter = get_cached_lookup(*cache_key)
+            if column_letter:
+                index = column_letter_to_index(column_letter)
+                if index < len(headers) and str(headers[index]).strip().lower() == column_name.lower():
+                    print(f"📍 Using cached column {column_letter} for '{column_name}'")
+                    return column_letter
+                print(f"⚠️ Cached column {column_letter} no longer holds '{column_name}', searching again")
+            
+            # Try exact case-sensitive match first
+            for i, header in enumerate(headers):
+                if str(header).strip() == column_name:
+                    column_letter = self.index_to_column_letter(i)
+                    print(f"📍 Found exact match for '{column_name}' at column {column_letter}")
+                    remember_lookup(column_letter, *cache_key)
+                    return column_letter
+            
+            # Try exact case-insensitive match
+            for i, header in enumerate(headers):
+                if str(header).strip().lower() == column_name.lower():
+                    column_letter = self.index_to_column_letter(i)
+                    print(f"📍 Found case-insensitive match for '{column_name}' at column {column_letter}")
+                    remember_lookup(column_letter, *cache_key)
+                    return column_letter
+            
+            print(f"❌ Column '{column_name}' not found in sheet headers")
+            return None
+            
+        except Exception as e:
+            print(f"❌ Error finding column: {str(e)}")
+            return None
+
+    @staticmethod
+    def _search_column_a(context, target_date_str):
+        """Row number of target_date_str in a context's column A, searching bottom-up since recent dates are near the end"""
+        column_a = context['column_a']
+        for i in range(len(column_a) - 1, -1, -1):
+            row = column_a[i]
+            if row and target_date_str in str(row[0]).strip():
+                return context['column_a_first_row'] + i  # Google Sheets is 1-indexed
+        return None
+
+    def _find_date_in_tab(self, spreadsheet_id, sheet_name, target_date_str):
+        """Row number of a date in a tab's column A: the tail read with the header row first, then the whole column"""
+        context = self.fetch_sheet_context(spreadsheet_id, sheet_name)
+        row_number = self._search_column_a(context, target_date_str)
+        
+        # Blank grid rows below the data can push the date above the tail that was read
+        if row_number is None and load_full_column_a(self.service, spreadsheet_id, sheet_name, context):
+            print(f"🔍 Date {target_date_str} not in the last rows of {sheet_name}, reading all of column A")
+            row_number = self._search_column_a(context, target_date_str)
+        return row_number
+
+    def _column_a_holds(self, spreadsheet_id, sheet_name, row_number, target_date_str):
+        """Whether column A of a tab still has target_date_str at row_number (checks a cached date row)"""
+        context = self.fetch_sheet_context(spreadsheet_id, sheet_name)
+        if row_number < context['column_a_first_row']:
+            # The row is above the tail that was read
+            load_full_column_a(self.service, spreadsheet_id, sheet_name, context)
+        index = row_number - context['column_a_first_row']
+        column_a = context['column_a']
+        return 0 <= index < len(column_a) and bool(column_a[index]) and target_date_str in str(column_a[index][0]).strip()
+
+    def find_date_row(self, target_date, sheet_name='Data', sheet_id=None):
+        """Find the row number for a specific date"""
+        try:
+            # Check if we have a sheet ID to work with
+            if not sheet_id and not hasattr(self, 'snapshot_sheet_id'):
+                print("❌ No snapshot sheet ID configured")
+                return None
+            
+            # Use provided sheet_id or fall back to snapshot_sheet_id
+            spreadsheet_id = sheet_id if sheet_id else self.snapshot_sheet_id
+            
+            target_date_str = target_date.strftime('%Y-%m-%d')
+            cache_key = ('date_row', spreadsheet_id, sheet_name, target_date_str)
+            cached_row = get_cached_lookup(*cache_key)
+            if cached_row:
+                # Reuse the row found within the last day while column A still has the date there
+                if self._column_a_holds(spreadsheet_id, sheet_name, cached_row, target_date_str):
+                    return cached_row, sheet_name
+                print(f"⚠️ Cached row {cached_row} no longer holds {target_date_str}, searching again")
+            
+            # Dates are in column A
+            row_number = self._find_date_in_tab(spreadsheet_id, sheet_name, target_date_str)
+            if row_number:
+                remember_lookup(row_number, *cache_key)
+                return row_number, sheet_name
+            
+            print(f"❌ Date {target_date_str} not found in column A")
+            return None, None
+            
+        except Exception as e:
+            print(f"❌ Error finding date row: {str(e)}")
+            return None, None
+
+    def find_header_column(self, spreadsheet_id, header_text, tabs=SNAPSHOT_TABS):
+        """Find the first of the candidate tabs with a header containing header_text.
+        
+        Returns (1-based column number, tab name), or (None, None) if no tab has it.
+        """
+        try:
+            # Column positions rarely change, so reuse the one found within the last day
+            # while the header row still has the column there
+            cache_key = ('column', spreadsheet_id, header_text)
+            cached = get_cached_lookup(*cache_key)
+            if cached:
+                column_number, cached_tab = cached
+                header_row = self.fetch_sheet_context(spreadsheet_id, cached_tab)['header_row']
+                if column_number <= len(header_row) and header_text in str(header_row[column_number - 1]):
+                    print(f"✅ Using cached '{header_text}' column {column_number} (sheet: {cached_tab})")
+                    return column_number, cached_tab
+                print(f"⚠️ Cached '{header_text}' column {column_number} no longer matches the headers, searching again")
+            
+            existing_tabs = self.tab_row_counts(spreadsheet_id)
+            for tab in dict.fromkeys(tabs):
+                if tab not in existing_tabs:
+                    continue
+                print(f"🔍 Looking for '{header_text}' column in sheet: {tab}")
+                header_row = self.fetch_sheet_context(spreadsheet_id, tab)['header_row']
+                column_number = next((i + 1 for i, header in enumerate(header_row)
+                                      if header and header_text in str(header)), None)
+                if column_number:
+                    print(f"✅ Found '{header_text}' in column {column_number} (sheet: {tab})")
+                    remember_lookup([column_number, tab], *cache_key)
+                    return column_number, tab
+                
+                print(f"🔍 '{header_text}' column not found in sheet {tab}")
+            
+        except Exception as e:
+            print(f"❌ Error reading sheet {spreadsheet_id}: {str(e)}")
+            return None, None
+        
+        print(f"❌ '{header_text}' column not found in any sheet")
+        return None, None
+
+    def find_date_in_tabs(self, spreadsheet_id, target_date_str, tabs=SNAPSHOT_TABS):
+        """Find the first of the candidate tabs whose column A holds target_date_str (2025-07-12 format).
+        
+        Returns (row number, tab name), or (None, None) if no tab has it.
+        """
+        try:
+            cache_key = ('date_row', spreadsheet_id, target_date_str)
+            cached = get_cached_lookup(*cache_key)
+            if cached:
+                # Reuse the row found within the last day while column A still has the date there
+                row_number, cached_tab = cached
+                if self._column_a_holds(spreadsheet_id, cached_tab, row_number, target_date_str):
+                    print(f"✅ Using cached row {row_number} for date {target_date_str} (sheet: {cached_tab})")
+                    return row_number, cached_tab
+                print(f"⚠️ Cached row {row_number} no longer holds {target_date_str}, searching again")
+            
+            existing_tabs = self.tab_row_counts(spreadsheet_id)
+            for tab in dict.fromkeys(tabs):
+                if tab not in existing_tabs:
+                    continue
+                print(f"🔍 Trying sheet: {tab}")
+                row_number = self._find_date_in_tab(spreadsheet_id, tab, target_date_str)
+                if row_number:
+                    print(f"✅ Found date {target_date_str} in sheet {tab}, row {row_number}")
+                    remember_lookup([row_number, tab], *cache_key)
+                    return row_number, tab
+                
+                print(f"🔍 Date {target_date_str} not found in sheet {tab}")
+            
+        except Exception as e:
+            print(f"❌ Error reading sheet {spreadsheet_id}: {str(e)}")
+            return None, None
+        
+        print(f"❌ Date {target_date_str} not found in any sheet")
+        return None, None
+
+    def update_cell_value(self, range_name, value, sheet_id=None):
+        """Queue an update of a specific cell with a value (written by flush_writes)"""
+        try:
+            # Check if we have a sheet ID to work with
+            if not sheet_id and not hasattr(self, 'snapshot_sheet_id'):
+                print("❌ No snapshot sheet ID configured")
+                return False
+            
+            # Use provided sheet_id or fall back to snapshot_sheet_id
+            spreadsheet_id = sheet_id if sheet_id else self.snapshot_sheet_id
+            
+            with self._pending_lock:
+                self._pending_writes.setdefault(spreadsheet_id, []).append({
+                    'range': range_name,
+                    'values': [[value]]
+                })
+            return True
+            
+        except Exception as e:
+            print(f"❌ Error updating cell {range_name}: {str(e)}")
+            return False
+
+    def flush_writes(self, value_input_option='RAW'):
+        """Write all queued cell updates with one values.batchUpdate per spreadsheet.
+        
+        Returns the set of spreadsheet IDs whose updates were written.
+        """
+        with self._pending_lock:
+            pending_writes = self._pending_writes
+            self._pending_writes = {}
+        
+        flushed_sheet_ids = set()
+        for spreadsheet_id, data in pending_writes.items():
+            try:
+                body = {
+                    'valueInputOption': value_input_option,
+                    'data': data
+                }
+                execute(self.service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body=body,
+                    fields=UPDATE_FIELDS
+                ))
+                flushed_sheet_ids.add(spreadsheet_id)
+                
+            except Exception as e:
+                print(f"❌ Error updating {len(data)} cell(s) in sheet {spreadsheet_id}: {str(e)}")
+        
+        return flushed_sheet_ids
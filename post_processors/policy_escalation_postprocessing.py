@@ -15,11 +15,40 @@ from datetime import datetime, timedelta
 from pathlib import Path
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
+from post_processors._sheets import column_letter_to_index, get_cached_lookup, remember_lookup
+
+try:
+    import pyarrow  # noqa: F401
+    _CSV_ENGINE = 'pyarrow'
+except ImportError:
+    _CSV_ENGINE = 'c'
+
+# Only these columns of the LLM output CSVs are consumed by the analysis
+_LLM_OUTPUT_COLUMNS = ['conversation_id', 'llm_output']
+
+# Pattern: policy_escalation_{dept_name}_{mm}_{dd}.csv
+_DEPT_RE = re.compile(r'policy_escalation_(.+)_\d{2}_\d{2}\.csv$')
+
+
+def read_llm_output_csv(filepath):
+    """Read an LLM output CSV, using the multithreaded pyarrow parser when available"""
+    if _CSV_ENGINE == 'pyarrow':
+        return pd.read_csv(filepath, engine='pyarrow', dtype_backend='pyarrow',
+                           usecols=_LLM_OUTPUT_COLUMNS)
+    return pd.read_csv(filepath, usecols=_LLM_OUTPUT_COLUMNS)
 
 
 class PolicyEscalationProcessor:
     """Post processor for Policy Escalation analysis results"""
     
+    # Department keys whose display names are not plain title case
+    _DEPT_NAME_OVERRIDES = {
+        'mv_resolvers': 'MV Resolvers',
+        'mv_sales': 'MV Sales',
+        'cc_sales': 'CC Sales',
+        'cc_resolvers': 'CC Resolvers',
+    }
+    
     def __init__(self, credentials_path='credentials.json'):
         # Create directory with date subfolder to match other processors
         yesterday = datetime.now() - timedelta(days=1)
@@ -38,6 +67,9 @@ class PolicyEscalationProcessor:
         
         # Will be set based on files found
         self.snapshot_sheet_id = None
+        
+        # Header row and date column of each snapshot sheet read this run, keyed by (sheet ID, sheet name)
+        self._sheet_index = {}
     
     def safe_json_parse(self, json_str):
         """Safely parse JSON string from LLM output"""
@@ -49,10 +81,9 @@ class PolicyEscalationProcessor:
             cleaned = str(json_str).strip()
             
             # Remove markdown code blocks if present
-            if cleaned.startswith('```json'):
-                cleaned = cleaned.replace('```json', '').replace('```', '').strip()
-            elif cleaned.startswith('```'):
-                cleaned = cleaned.replace('```', '').strip()
+            if cleaned.startswith('```'):
+                cleaned = cleaned.removeprefix('```json').removeprefix('```')
+                cleaned = cleaned.removesuffix('```').strip()
             
             return json.loads(cleaned)
         except json.JSONDecodeError as e:
@@ -85,21 +116,46 @@ class PolicyEscalationProcessor:
                 break
         return result
 
+    def _load_sheet_index(self, sheet_name='Data'):
+        """Load the header row and date column of the snapshot sheet (read once per run)"""
+        cache_key = (self.snapshot_sheet_id, sheet_name)
+        if cache_key in self._sheet_index:
+            return self._sheet_index[cache_key]
+        
+        # Fetch headers and dates in a single round-trip
+        result = self.service.spreadsheets().values().batchGet(
+            spreadsheetId=self.snapshot_sheet_id,
+            ranges=[f"{sheet_name}!1:1", f"{sheet_name}!A:A"]
+        ).execute()
+        
+        value_ranges = result.get('valueRanges', [])
+        header_rows = value_ranges[0].get('values', []) if value_ranges else []
+        date_rows = value_ranges[1].get('values', []) if len(value_ranges) > 1 else []
+        entry = {
+            'headers': header_rows[0] if header_rows else [],
+            'dates': [str(row[0]).strip() if row else '' for row in date_rows]
+        }
+        
+        self._sheet_index[cache_key] = entry
+        return entry
+
     def find_column_by_name(self, column_name, sheet_name='Data'):
         """Find column letter by searching for exact column name"""
         try:
-            # Get the first row to search for column headers
-            range_name = f"{sheet_name}!1:1"
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.snapshot_sheet_id,
-                range=range_name
-            ).execute()
-            
-            values = result.get('values', [])
-            if not values:
+            headers = self._load_sheet_index(sheet_name)['headers']
+            if not headers:
                 return None
             
-            headers = values[0]
+            # Reuse the column found within the last day while the header row still has it there
+            cache_key = ('column', self.snapshot_sheet_id, f"{sheet_name}!{column_name}")
+            col_letter = get_cached_lookup(*cache_key)
+            if col_letter:
+                index = column_letter_to_index(col_letter)
+                if index < len(headers) and str(headers[index]).strip().lower() == column_name.lower():
+                    print(f"📍 Using cached column {col_letter} for '{column_name}'")
+                    return col_letter
+                print(f"⚠️ Cached column {col_letter} no longer holds '{column_name}', searching again")
+            
             print(f"🔍 Searching for column '{column_name}' in headers...")
             
             for i, header in enumerate(headers):
@@ -110,6 +166,7 @@ class PolicyEscalationProcessor:
                     # Exact match first
                     if header_clean == column_name:
                         print(f"📍 Found exact match for '{column_name}' at column {col_letter}")
+                        remember_lookup(col_letter, *cache_key)
                         return col_letter
             
             # If no exact match, try case-insensitive exact match
@@ -119,6 +176,7 @@ class PolicyEscalationProcessor:
                     if header_clean.lower() == column_name.lower():
                         col_letter = self.index_to_column_letter(i)
                         print(f"📍 Found case-insensitive match for '{column_name}' at column {col_letter}")
+                        remember_lookup(col_letter, *cache_key)
                         return col_letter
             
             print(f"⚠️ Column '{column_name}' not found in snapshot sheet")
@@ -132,26 +190,24 @@ class PolicyEscalationProcessor:
     def find_date_row(self, target_date, sheet_name='Data'):
         """Find the row number for a specific date"""
         try:
-            # Get column A (dates) to search
-            range_name = f"{sheet_name}!A:A"
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.snapshot_sheet_id,
-                range=range_name
-            ).execute()
-            
-            values = result.get('values', [])
-            if not values:
-                return None
-            
             target_date_str = target_date.strftime('%Y-%m-%d')
-            
-            for i, row in enumerate(values):
-                if row and len(row) > 0:
-                    date_cell = str(row[0]).strip()
-                    if target_date_str in date_cell:
-                        row_number = i + 1  # Sheets are 1-indexed
-                        print(f"📍 Found date {target_date_str} at row {row_number}")
-                        return row_number
+            cache_key = ('date_row', self.snapshot_sheet_id, sheet_name, target_date_str)
+            dates = self._load_sheet_index(sheet_name)['dates']
+            
+            # Reuse the row found within the last day while column A still has the date there
+            cached_row = get_cached_lookup(*cache_key)
+            if cached_row:
+                if cached_row <= len(dates) and target_date_str in dates[cached_row - 1]:
+                    print(f"📍 Using cached row {cached_row} for date {target_date_str}")
+                    return cached_row
+                print(f"⚠️ Cached row {cached_row} no longer holds {target_date_str}, searching again")
+            
+            for i, date_cell in enumerate(dates):
+                if target_date_str in date_cell:
+                    row_number = i + 1  # Sheets are 1-indexed
+                    print(f"📍 Found date {target_date_str} at row {row_number}")
+                    remember_lookup(row_number, *cache_key)
+                    return row_number
             
             print(f"⚠️ Date {target_date_str} not found in snapshot sheet")
             return None
@@ -221,26 +277,20 @@ class PolicyEscalationProcessor:
         date_folder = yesterday.strftime('%Y-%m-%d')
         date_str = yesterday.strftime('%m_%d')
         
-        llm_outputs_dir = f"outputs/LLM_outputs/{date_folder}"
+        llm_outputs_dir = Path(f"outputs/LLM_outputs/{date_folder}")
         
-        if not os.path.exists(llm_outputs_dir):
+        if not llm_outputs_dir.is_dir():
             print(f"❌ LLM outputs directory not found: {llm_outputs_dir}")
             return []
         
         policy_escalation_files = []
         
         # Look for Policy Escalation files: policy_escalation_{dept_name}_{date}.csv
-        for filename in os.listdir(llm_outputs_dir):
-            if filename.startswith('policy_escalation_') and filename.endswith(f'_{date_str}.csv'):
-                filepath = os.path.join(llm_outputs_dir, filename)
-                
-                # Extract department name from filename
-                # Pattern: policy_escalation_{dept_name}_{date}.csv
-                dept_match = re.match(r'policy_escalation_(.+)_\d{2}_\d{2}\.csv$', filename)
-                if dept_match:
-                    dept_key = dept_match.group(1)
-                    policy_escalation_files.append((filepath, dept_key, filename))
-                    print(f"📁 Found Policy Escalation file: {filename}")
+        for entry in llm_outputs_dir.glob(f'policy_escalation_*_{date_str}.csv'):
+            dept_match = _DEPT_RE.match(entry.name)
+            if dept_match:
+                policy_escalation_files.append((str(entry), dept_match.group(1), entry.name))
+                print(f"📁 Found Policy Escalation file: {entry.name}")
         
         if not policy_escalation_files:
             print(f"⚠️  No Policy Escalation files found in {llm_outputs_dir}")
@@ -252,8 +302,8 @@ class PolicyEscalationProcessor:
         try:
             print(f"📊 Analyzing Policy Escalation data: {os.path.basename(filepath)}")
             
-            # Read the LLM output CSV
-            df = pd.read_csv(filepath)
+            # Read the LLM output CSV (only the columns we need)
+            df = read_llm_output_csv(filepath)
             
             if df.empty:
                 print("⚠️  Empty DataFrame")
@@ -267,10 +317,8 @@ class PolicyEscalationProcessor:
             valid_outputs = 0
             
             # Process each conversation
-            for _, row in df.iterrows():
-                conversation_id = str(row['conversation_id'])
-                llm_output = row['llm_output']
-                
+            for conversation_id, llm_output in zip(df['conversation_id'].tolist(),
+                                                   df['llm_output'].tolist()):
                 # Parse the JSON response
                 parsed_output = self.safe_json_parse(llm_output)
                 
@@ -308,20 +356,8 @@ class PolicyEscalationProcessor:
     
     def convert_dept_key_to_name(self, dept_key):
         """Convert department key to proper name for display"""
-        # Handle underscores and convert to title case
-        dept_name = dept_key.replace('_', ' ').title()
-        
-        # Handle specific department name mappings
-        if dept_name == 'Mv Resolvers':
-            return 'MV Resolvers'
-        elif dept_name == 'Mv Sales':
-            return 'MV Sales'
-        elif dept_name == 'Cc Sales':
-            return 'CC Sales'
-        elif dept_name == 'Cc Resolvers':
-            return 'CC Resolvers'
-        else:
-            return dept_name
+        # Handle specific department name mappings, otherwise title-case the key
+        return self._DEPT_NAME_OVERRIDES.get(dept_key.lower(), dept_key.replace('_', ' ').title())
     
     def save_processed_data(self, analysis_results, dept_name):
         """Process data but don't save duplicate files (original LLM output already exists)"""
@@ -4,357 +4,250 @@ Rule Breaking Post-Processing Script
 Analyzes rule violations from LLM outputs and creates summaries
 """
 
-import pandas as pd
+import csv
+import heapq
+import io
 import json
 import os
+import re
+from functools import lru_cache
+from operator import itemgetter
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from collections import defaultdict, Counter
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+from concurrent.futures import ProcessPoolExecutor
+from post_processors._sheets import DEPARTMENT_SHEETS, index_to_column_letter
+from post_processors._sheets_base import SNAPSHOT_TABS, SnapshotSheetProcessor
 
-class RuleBreakingProcessor:
-    def __init__(self, credentials_path='credentials.json'):
-        """Initialize Rule Breaking Processor with Google Sheets integration"""
-        self.credentials_path = credentials_path
-        self.service = None
-        self.setup_sheets_api()
-        
-        # Department sheet IDs from sa_post_processing.py
-        self.department_sheets = {
-            'Doctors': '1STHimb0IJ077iuBtTOwsa-GD8jStjU3SiBW7yBWom-E',
-            'Delighters': '1PV0ZmobUYKHGZvHC7IfJ1t6HrJMTFi6YRbpISCouIfQ',
-            'CC Sales': '1te1fbAXhURIUO0EzQ2Mrorv3a6GDtEVM_5np9TO775o',
-            'CC Resolvers': '1QdmaTc5F2VUJ0Yu0kNF9d6ETnkMOlOgi18P7XlBSyHg',
-            'Filipina': '1E5wHZKSDXQZlHIb3sV4ZWqIxvboLduzUEU0eupK7tys',
-            'African': '1__KlrVjcpR8RoYfTYMYZ_EgddUSXMhK3bJO0fTGwDig',
-            'Ethiopian': '1ENzdgiwUEtBSb5sHZJWs5aG8g2H62Low8doaDZf8s90',
-            'MV Resolvers': '1XkVcHlkh8fEp7mmBD1Zkavdp2blBLwSABT1dE_sOf74',
-            'MV Sales': '1agrl9hlBhemXkiojuWKbqiMHKUzxGgos4JSkXxw7NAk'
-        }
-        
-        # Ensure output directory exists with date subfolder
-        yesterday = datetime.now() - timedelta(days=1)
-        date_folder = yesterday.strftime('%Y-%m-%d')
-        self.rule_breaking_dir = f"outputs/rule_breaking/{date_folder}"
-        os.makedirs(self.rule_breaking_dir, exist_ok=True)
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
-    def setup_sheets_api(self):
-        """Setup Google Sheets API authentication"""
-        try:
-            SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-            
-            if os.path.exists(self.credentials_path):
-                creds = Credentials.from_service_account_file(
-                    self.credentials_path, scopes=SCOPES)
-                self.service = build('sheets', 'v4', credentials=creds)
-                print("✅ Google Sheets API authenticated successfully")
-                return True
-            else:
-                print(f"❌ Credentials file not found: {self.credentials_path}")
-                return False
-                
-        except Exception as e:
-            print(f"❌ Error setting up Google Sheets API: {str(e)}")
-            return False
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
-    def find_rule_breaking_column(self, sheet_id, sheet_name='Sheet1'):
-        """Find the column number for 'Rule Breaking' header"""
-        if not self.service:
-            print("❌ Google Sheets service not available")
-            return None, None
-            
-        # Try different sheet names - prioritize Data first
-        sheet_names_to_try = ['Data', sheet_name, 'Sheet1', 'Main']
-        
-        for current_sheet_name in sheet_names_to_try:
-            try:
-                print(f"🔍 Looking for 'Rule Breaking' column in sheet: {current_sheet_name}")
-                # Get the first row (header row) across a wide range
-                range_name = f"{current_sheet_name}!1:1"
-                result = self.service.spreadsheets().values().get(
-                    spreadsheetId=sheet_id, range=range_name).execute()
-                
-                values = result.get('values', [])
-                
-                if values and len(values) > 0:
-                    header_row = values[0]
-                    # Look for "Rule Breaking" in the header row
-                    for col_idx, header in enumerate(header_row):
-                        if header and "Rule Breaking" in str(header):
-                            column_number = col_idx + 1  # Convert to 1-based indexing
-                            print(f"✅ Found 'Rule Breaking' in column {column_number} (sheet: {current_sheet_name})")
-                            return column_number, current_sheet_name
-                
-                print(f"🔍 'Rule Breaking' column not found in sheet {current_sheet_name}")
-                
-            except Exception as e:
-                pass
-        
-        print(f"❌ 'Rule Breaking' column not found in any sheet")
-        return None, None
+# Errors that skip a single conversation rather than the whole file
+_PARSE_ERRORS = (json.JSONDecodeError, KeyError, TypeError)
+if ijson is not None:
+    _PARSE_ERRORS += (ijson.JSONError,)
 
-    def find_date_row(self, sheet_id, target_date, sheet_name='Sheet1'):
-        """Find row with target date (2025-07-12 format) in column A"""
-        if not self.service:
-            print("❌ Google Sheets service not available")
-            return None, None
-            
-        # Try different sheet names - prioritize Data first
-        sheet_names_to_try = ['Data', sheet_name, 'Sheet1', 'Main']
+# llm_output payloads larger than this are stream-parsed with ijson when available
+_STREAM_PARSE_THRESHOLD = 1024 * 1024  # characters
+
+# Markdown code block around JSON: ```json ... ``` or ``` ... ```
+_FENCE_RE = re.compile(r'```(?:json)?\s*\n?(.*?)\n?```', re.DOTALL)
+
+# Filename department keys whose department name is not plain title case,
+# including prompt-prefixed keys (mvr_, ccs_, mvs_, doc_)
+_DEPT_NAME_MAP = {
+    'mvr_mv_resolvers': 'MV Resolvers',
+    'ccs_cc_sales': 'CC Sales',
+    'mvs_mv_sales': 'MV Sales',
+    'doc_doctors': 'Doctors',
+    'cc_sales': 'CC Sales',
+    'cc_resolvers': 'CC Resolvers',
+    'mv_resolvers': 'MV Resolvers',
+    'mv_sales': 'MV Sales',
+}
+
+# llm_output values that mean the LLM returned nothing usable
+_EMPTY_OUTPUTS = frozenset({'', 'nan', '(empty)'})
+
+# LLM outputs can exceed the csv module's default 128 KB field limit
+csv.field_size_limit(2**31 - 1)
+
+
+@lru_cache(maxsize=4096)
+def normalize_rule(rule):
+    """Normalize a violated rule string to 'number:title' with spaces instead of underscores"""
+    # Replace ": " with ":" to standardize formatting
+    normalized_rule = rule.replace(': ', ':')
+    # Replace underscores with spaces in rule titles
+    if ':' in normalized_rule:
+        rule_num, rule_title = normalized_rule.split(':', 1)
+        rule_title = rule_title.replace('_', ' ')
+        normalized_rule = f"{rule_num}:{rule_title}"
+    return normalized_rule
+
+
+def iter_llm_output_rows(filepath):
+    """Stream (llm_output, conversation_id) pairs from an LLM output CSV"""
+    with open(filepath, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            # Short rows leave missing fields as None
+            yield row['llm_output'] or '', row['conversation_id']
+
+
+@dataclass(frozen=True)
+class _RunDate:
+    """Date of the data being processed, in each format the processor needs"""
+    iso: str   # 2025-07-12: date folders and sheet date rows
+    mmdd: str  # 07_12: LLM output filenames
+
+    @classmethod
+    def from_date(cls, day):
+        return cls(iso=day.strftime('%Y-%m-%d'), mmdd=day.strftime('%m_%d'))
+
+
+class RuleBreakingProcessor(SnapshotSheetProcessor):
+    def __init__(self, credentials_path='credentials.json', run_date=None):
+        """Initialize Rule Breaking Processor with Google Sheets integration.
         
-        for current_sheet_name in sheet_names_to_try:
-            try:
-                print(f"🔍 Trying sheet: {current_sheet_name}")
-                # Get all data from column A
-                range_name = f"{current_sheet_name}!A:A"
-                result = self.service.spreadsheets().values().get(
-                    spreadsheetId=sheet_id, range=range_name).execute()
-                
-                values = result.get('values', [])
-                
-                # Find the row with target date
-                for i, row in enumerate(values):
-                    if row and len(row) > 0:
-                        cell_value = str(row[0]).strip()
-                        if target_date in cell_value:
-                            print(f"✅ Found date {target_date} in sheet {current_sheet_name}, row {i+1}")
-                            return i + 1, current_sheet_name
-                
-                print(f"🔍 Date {target_date} not found in sheet {current_sheet_name}")
-                
-            except Exception as e:
-                pass
+        run_date is the date of the data to process (defaults to yesterday), fixed for the processor's lifetime.
+        """
+        super().__init__(credentials_path)
+        self.run_date = _RunDate.from_date(run_date or datetime.now() - timedelta(days=1))
         
-        print(f"❌ Date {target_date} not found in any sheet")
-        return None, None
-
-    def update_cell_value(self, sheet_id, sheet_name, row, col, value):
-        """Update a specific cell with the rule breaking percentage"""
-        if not self.service:
-            print("❌ Google Sheets service not available")
-            return False
-            
-        try:
-            # Convert column number to letter (1=A, 2=B, etc.)
-            if col <= 26:
-                col_letter = chr(64 + col)  # A-Z
-            else:
-                # For columns beyond Z
-                first_letter = chr(64 + ((col - 1) // 26))
-                second_letter = chr(64 + ((col - 1) % 26) + 1)
-                col_letter = first_letter + second_letter
-                
-            range_name = f"{sheet_name}!{col_letter}{row}"
-            
-            # Update the cell
-            body = {
-                'values': [[value]]
-            }
-            
-            result = self.service.spreadsheets().values().update(
-                spreadsheetId=sheet_id,
-                range=range_name,
-                valueInputOption='RAW',
-                body=body
-            ).execute()
-            
-            print(f"✅ Updated {range_name} with Rule Breaking %: {value}")
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error updating cell: {str(e)}")
-            return False
+        # Department sheet IDs shared with the other snapshot processors
+        self.department_sheets = dict(DEPARTMENT_SHEETS)
+        
+        # Output directory with date subfolder (created when the first report is written)
+        self.rule_breaking_dir = f"outputs/rule_breaking/{self.run_date.iso}"
 
     def find_rule_breaking_files(self):
         """Find rule_breaking files for YESTERDAY'S date only in LLM_outputs"""
         # Look in yesterday's date subfolder
-        yesterday = datetime.now() - timedelta(days=1)
-        date_folder = yesterday.strftime('%Y-%m-%d')
-        output_dir = f"outputs/LLM_outputs/{date_folder}"
+        output_dir = f"outputs/LLM_outputs/{self.run_date.iso}"
         rule_breaking_files = []
         
         # Get yesterday's date in mm_dd format
-        yesterday_date = (datetime.now() - timedelta(days=1)).strftime('%m_%d')
+        yesterday_date = self.run_date.mmdd
         print(f"🔍 Looking for rule breaking files from yesterday: {yesterday_date}")
         
         if not os.path.exists(output_dir):
             print(f"❌ Directory not found: {output_dir}")
             return []
         
-        for filename in os.listdir(output_dir):
-            if filename.startswith('rule_breaking_') and filename.endswith('.csv'):
-                # Check if filename ends with yesterday's date: rule_breaking_dept_name_mm_dd.csv
-                if filename.endswith(f'_{yesterday_date}.csv'):
-                    # Extract department from filename: rule_breaking_dept_name_mm_dd.csv
-                    parts = filename.replace('.csv', '').split('_')
-                    if len(parts) >= 3:
-                        dept_part = '_'.join(parts[2:-2])  # Handle multi-word department names
-                        filepath = os.path.join(output_dir, filename)
-                        rule_breaking_files.append((filepath, dept_part, filename))
-                        print(f"📁 Found yesterday's file: {filename} -> Department: {dept_part}")
-                else:
-                    print(f"⏭️  Skipping old file: {filename} (not from {yesterday_date})")
+        # Match rule_breaking_{dept_name}_{mm_dd}.csv, capturing multi-word department names
+        pattern = re.compile(rf'^rule_breaking_(.+)_{re.escape(yesterday_date)}\.csv$')
+        with os.scandir(output_dir) as entries:
+            for entry in entries:
+                match = pattern.match(entry.name)
+                if match:
+                    dept_part = match.group(1)
+                    rule_breaking_files.append((entry.path, dept_part, entry.name))
+                    print(f"📁 Found yesterday's file: {entry.name} -> Department: {dept_part}")
         
         print(f"✅ Found {len(rule_breaking_files)} rule breaking files for yesterday ({yesterday_date})")
         return rule_breaking_files
 
-    def extract_json_from_llm_output(self, llm_output_str):
+    @staticmethod
+    def extract_json_from_llm_output(llm_output_str):
         """Extract JSON content from LLM output, handling both markdown and plain JSON"""
-        import re
-        
         # Clean up the string
         llm_output_str = llm_output_str.strip()
         
-        # Try to extract JSON from markdown code blocks first
-        # Look for ```json ... ``` or ``` ... ``` patterns
-        json_pattern = r'```(?:json)?\s*\n?(.*?)\n?```'
-        match = re.search(json_pattern, llm_output_str, re.DOTALL)
+        # Bare JSON is the common case; skip the regex entirely
+        if '```' not in llm_output_str:
+            return llm_output_str
         
+        # Extract JSON from ```json ... ``` or ``` ... ``` code blocks
+        match = _FENCE_RE.search(llm_output_str)
         if match:
-            # Extract content from code block
-            json_content = match.group(1).strip()
-            return json_content
+            return match.group(1).strip()
         
-        # If no markdown code blocks found, return the original string
+        # If no complete code block found, return the original string
         return llm_output_str
 
-    def analyze_rule_breaking_data(self, filepath):
-        """Analyze rule breaking data from a CSV file"""
+    @staticmethod
+    def analyze_rule_breaking_data(filepath):
+        """Analyze rule breaking data from a CSV file (static so it can run in a worker process)"""
         try:
-            df = pd.read_csv(filepath)
-            print(f"📊 Reading {len(df)} conversations from {os.path.basename(filepath)}")
-            
             # Initialize counters
             total_convs = 0
+            total_msgs = 0
             conv_violations = Counter()  # Count of conversations by number of violations
             
-            # First pass: collect all possible rules from all conversations
-            all_rules = set()
-            conversations_data = []
+            # Only violations are counted; good counts are derived from the totals
+            msg_break_counts = Counter()  # Messages violating each rule
+            conv_break_counts = Counter()  # Conversations violating each rule
             
-            for _, row in df.iterrows():
+            rows_read = 0
+            for llm_output_str, conversation_id in iter_llm_output_rows(filepath):
+                rows_read += 1
                 try:
-                    llm_output_str = str(row['llm_output'])
-                    
                     # Skip empty or invalid responses
-                    if pd.isna(row['llm_output']) or llm_output_str.strip() in ['', 'nan', '(empty)']:
+                    if llm_output_str.strip() in _EMPTY_OUTPUTS:
                         continue
                     
                     # Extract JSON content, handling markdown code blocks
-                    json_content = self.extract_json_from_llm_output(llm_output_str)
-                    llm_output = json.loads(json_content)
+                    json_content = RuleBreakingProcessor.extract_json_from_llm_output(llm_output_str)
                     
-                    # Handle cases where LLM returns a list instead of a dict
-                    if isinstance(llm_output, list):
-                        # If it's a list, wrap it in a dict with 'messages' key
-                        llm_output = {'messages': llm_output, 'chat_id': row['conversation_id']}
-                    elif not isinstance(llm_output, dict):
-                        # Skip if it's neither list nor dict
-                        print(f"⚠️  Unexpected LLM output format: {type(llm_output)}, Chat ID {row['conversation_id']}")
-                        continue
+                    if ijson is not None and len(json_content) > _STREAM_PARSE_THRESHOLD \
+                            and json_content.startswith('{'):
+                        # Stream messages out of very large payloads instead of building the whole tree
+                        messages = ijson.items(io.BytesIO(json_content.encode()), 'messages.item')
+                        chat_id = conversation_id
+                    else:
+                        # orjson.JSONDecodeError subclasses json.JSONDecodeError
+                        llm_output = _json_loads(json_content)
+                        
+                        # Handle cases where LLM returns a list instead of a dict
+                        if isinstance(llm_output, list):
+                            # If it's a list, wrap it in a dict with 'messages' key
+                            llm_output = {'messages': llm_output, 'chat_id': conversation_id}
+                        elif not isinstance(llm_output, dict):
+                            # Skip if it's neither list nor dict
+                            print(f"⚠️  Unexpected LLM output format: {type(llm_output)}, Chat ID {conversation_id}")
+                            continue
+                        
+                        messages = llm_output.get('messages', [])
+                        chat_id = llm_output.get('chat_id', 'unknown')
                     
                     conv_violation_count = 0
                     violated_rules_in_conv = set()
-                    messages_data = []
+                    conv_msgs = 0
+                    conv_msg_break_counts = Counter()
                     
                     # Process each message in the conversation
-                    for message in llm_output.get('messages', []):
+                    for message in messages:
                         if not isinstance(message, dict):
-                            print(f"⚠️  Message is not a dict: {type(message)}, Chat ID {llm_output.get('chat_id', 'unknown')}")
+                            print(f"⚠️  Message is not a dict: {type(message)}, Chat ID {chat_id}")
                             continue
                             
-                        violated_rules = message.get('violated_rules', [])
-                        
-                        # Normalize rule formatting (remove extra spaces after colon and replace underscores with spaces)
-                        normalized_rules = []
-                        for rule in violated_rules:
-                            # Replace ": " with ":" to standardize formatting
-                            normalized_rule = rule.replace(': ', ':')
-                            # Replace underscores with spaces in rule titles
-                            if ':' in normalized_rule:
-                                rule_num, rule_title = normalized_rule.split(':', 1)
-                                rule_title = rule_title.replace('_', ' ')
-                                normalized_rule = f"{rule_num}:{rule_title}"
-                            normalized_rules.append(normalized_rule)
-                        
-                        # Collect all rules (normalized)
-                        all_rules.update(normalized_rules)
-                        violated_rules = normalized_rules  # Use normalized rules going forward
+                        # Normalize rule formatting (remove extra spaces after colon and replace underscores with spaces);
+                        # a rule repeated within one message counts once
+                        violated_rules = {normalize_rule(rule) for rule in message.get('violated_rules', [])}
                         
                         # Count violations for this message
                         if violated_rules:
                             conv_violation_count += len(violated_rules)
-                            for rule in violated_rules:
-                                violated_rules_in_conv.add(rule)
+                            conv_msg_break_counts.update(violated_rules)
+                            violated_rules_in_conv |= violated_rules
                         
-                        messages_data.append(violated_rules)
+                        conv_msgs += 1
                     
-                    # Normalize conversation-level violated rules too
-                    normalized_conv_rules = set()
-                    for rule in violated_rules_in_conv:
-                        # Apply same normalization as message-level rules
-                        normalized_rule = rule.replace(': ', ':')
-                        if ':' in normalized_rule:
-                            rule_num, rule_title = normalized_rule.split(':', 1)
-                            rule_title = rule_title.replace('_', ' ')
-                            normalized_rule = f"{rule_num}:{rule_title}"
-                        normalized_conv_rules.add(normalized_rule)
+                    total_convs += 1
+                    total_msgs += conv_msgs
+                    msg_break_counts.update(conv_msg_break_counts)
+                    conv_break_counts.update(violated_rules_in_conv)
                     
-                    conversations_data.append({
-                        'messages': messages_data,
-                        'violated_rules_in_conv': normalized_conv_rules,
-                        'conv_violation_count': conv_violation_count
-                    })
+                    # Categorize conversation by violation count (3 means 3+ violations)
+                    conv_violations[min(conv_violation_count, 3)] += 1
                     
-                except (json.JSONDecodeError, KeyError, TypeError) as e:
+                except _PARSE_ERRORS as e:
                     #print error with conv id and row number
-                    print(f"⚠️  Error parsing: {str(e)}, Chat ID {row['conversation_id']}")
+                    print(f"⚠️  Error parsing: {str(e)}, Chat ID {conversation_id}")
                     continue
             
-            # Initialize rule_stats with all rules
+            print(f"📊 Read {rows_read} conversations from {os.path.basename(filepath)}")
+            
+            # Build statistics for every rule violated at least once
             rule_stats = {}
-            for rule in all_rules:
+            for rule, broken_msgs in msg_break_counts.items():
+                broken_convs = conv_break_counts[rule]
                 rule_stats[rule] = {
-                    'total_convs': 0, 'good_convs': 0, 'broken_convs': 0,
-                    'good_msgs': 0, 'broken_msgs': 0
+                    'total_convs': total_convs,
+                    'good_convs': total_convs - broken_convs,
+                    'broken_convs': broken_convs,
+                    'good_msgs': total_msgs - broken_msgs,
+                    'broken_msgs': broken_msgs
                 }
             
-            # Second pass: update statistics for all rules for each conversation
-            total_convs = len(conversations_data)
-            
-            for conv_data in conversations_data:
-                violated_rules_in_conv = conv_data['violated_rules_in_conv']
-                conv_violation_count = conv_data['conv_violation_count']
-                messages_data = conv_data['messages']
-                
-                # Categorize conversation by violation count
-                if conv_violation_count == 0:
-                    conv_violations[0] += 1
-                elif conv_violation_count == 1:
-                    conv_violations[1] += 1
-                elif conv_violation_count == 2:
-                    conv_violations[2] += 1
-                else:
-                    conv_violations[3] += 1  # 3+ violations
-                
-                # Update statistics for ALL rules
-                for rule in all_rules:
-                    # Update total conversations for all rules
-                    rule_stats[rule]['total_convs'] += 1
-                    
-                    # Update conversation statistics
-                    if rule in violated_rules_in_conv:
-                        rule_stats[rule]['broken_convs'] += 1
-                    else:
-                        rule_stats[rule]['good_convs'] += 1
-                    
-                    # Update message statistics
-                    for message_violations in messages_data:
-                        if rule in message_violations:
-                            rule_stats[rule]['broken_msgs'] += 1
-                        else:
-                            rule_stats[rule]['good_msgs'] += 1
-            
             return {
                 'total_convs': total_convs,
                 'conv_violations': conv_violations,
@@ -365,8 +258,8 @@ class RuleBreakingProcessor:
             print(f"❌ Error analyzing {filepath}: {str(e)}")
             return None
 
-    def create_summary_report(self, analysis_results, department, output_filename):
-        """Create a summary report similar to the example CSV"""
+    def create_summary_report(self, analysis_results, department, output_filename, top_k=None):
+        """Create a summary report similar to the example CSV (optionally limited to the top_k rules)"""
         try:
             total_convs = analysis_results['total_convs']
             conv_violations = analysis_results['conv_violations']
@@ -404,15 +297,19 @@ class RuleBreakingProcessor:
                 '% Convs Broken'
             ])
             
-            # Sort rules by percentage of conversations broken (descending)
-            sorted_rules = sorted(
-                rule_stats.items(),
-                key=lambda x: (x[1]['broken_convs'] / max(x[1]['total_convs'], 1)) * 100,
-                reverse=True
-            )
+            # Percentage of conversations broken, computed once per rule
+            rule_pcts = [
+                ((stats['broken_convs'] / max(stats['total_convs'], 1)) * 100, rule, stats)
+                for rule, stats in rule_stats.items()
+            ]
             
-            for rule, stats in sorted_rules:
-                pct_broken = (stats['broken_convs'] / max(stats['total_convs'], 1)) * 100
+            # Sort rules by percentage of conversations broken (descending), keeping only the top_k if set
+            if top_k is None:
+                sorted_rules = sorted(rule_pcts, key=itemgetter(0), reverse=True)
+            else:
+                sorted_rules = heapq.nlargest(top_k, rule_pcts, key=itemgetter(0))
+            
+            for pct_broken, rule, stats in sorted_rules:
                 summary_data.append([
                     rule,
                     stats['total_convs'],
@@ -423,15 +320,16 @@ class RuleBreakingProcessor:
                     f"{pct_broken:.2f}%"
                 ])
             
-            # Create DataFrame and save
+            # Write the rows straight to CSV under the chatbot summary header
             columns = [
                 'Chat-bot', 'Total Convs', '0 violations', '1 violation',
                 '2 violations', '3+ violations', '% convs ≥ 1'
             ]
-            df = pd.DataFrame(summary_data)
-            df.columns = columns
-            
-            df.to_csv(output_filename, index=False)
+            os.makedirs(os.path.dirname(output_filename) or '.', exist_ok=True)
+            with open(output_filename, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f, lineterminator='\n')
+                writer.writerow(columns)
+                writer.writerows(summary_data)
             print(f"✅ Summary report saved to: {output_filename}")
             
             return pct_convs_ge_1  # Return the percentage for uploading to sheets
@@ -450,99 +348,123 @@ class RuleBreakingProcessor:
             print(f"❌ No sheet ID found for {department}")
             return False
         
-        # Find the 'Rule Breaking' column
-        column_result = self.find_rule_breaking_column(sheet_id)
-        if not column_result or len(column_result) != 2:
-            print(f"❌ Could not find 'Rule Breaking' column for {department}")
+        if not self.service:
+            print("❌ Google Sheets service not available")
             return False
-            
-        column, found_sheet_name = column_result
-        if not column or not found_sheet_name:
+        
+        # Find the 'Rule Breaking' column, then the row with yesterday's date (trying the column's tab first)
+        yesterday_date = self.run_date.iso
+        column, found_sheet_name = self.find_header_column(sheet_id, 'Rule Breaking')
+        if not column:
             print(f"❌ Could not find 'Rule Breaking' column for {department}")
             return False
         
-        # Find row with yesterday's date
-        yesterday_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-        date_row, found_sheet_name = self.find_date_row(sheet_id, yesterday_date, found_sheet_name)
-        
+        date_row, found_sheet_name = self.find_date_in_tabs(sheet_id, yesterday_date,
+                                                            (found_sheet_name,) + SNAPSHOT_TABS)
         if not date_row:
             print(f"❌ Could not find yesterday's date ({yesterday_date}) in {department} sheet")
             return False
         
-        # Update the cell with percentage
+        # Convert column number to letter (1=A, 27=AA, etc.)
+        col_letter = index_to_column_letter(column - 1)
+        
+        # Queue the cell update; it is written by flush_writes()
         formatted_percentage = f"{percentage_value:.2f}%"
-        success = self.update_cell_value(sheet_id, found_sheet_name, date_row, column, formatted_percentage)
+        range_name = f"{found_sheet_name}!{col_letter}{date_row}"
+        success = self.update_cell_value(range_name, formatted_percentage, sheet_id=sheet_id)
         
         if success:
-            print(f"✅ Successfully updated {department} sheet with {formatted_percentage}")
+            print(f"✅ Queued {department} sheet update with {formatted_percentage}")
         else:
-            print(f"❌ Failed to update {department} sheet")
+            print(f"❌ Failed to queue {department} sheet update")
             
         return success
 
-    def process_all_departments(self):
-        """Process all rule breaking files and upload to Google Sheets"""
+    def convert_dept_key_to_name(self, dept_key):
+        """Convert a filename department key (optionally prompt-prefixed) to the department name"""
+        return _DEPT_NAME_MAP.get(dept_key.lower(), dept_key.replace('_', ' ').title())
+
+    def _process_department(self, dept_name, filename, analysis_results):
+        """Write one department's summary report from its analysis and queue its percentage upload.
+        
+        Returns True if the department's snapshot update was queued.
+        """
+        try:
+            print(f"\n📊 Processing {filename}...")
+            if not analysis_results:
+                return False
+            
+            # Create summary report where the rule breaking uploader looks for it
+            output_filename = f"{self.rule_breaking_dir}/{dept_name}_Rule_Breaking_Summary.csv"
+            percentage_ge_1 = self.create_summary_report(analysis_results, dept_name, output_filename)
+            
+            if percentage_ge_1 is None:
+                return False
+            
+            # Queue the Google Sheets update
+            return bool(self.upload_to_google_sheets(dept_name, percentage_ge_1))
+            
+        except Exception as e:
+            print(f"❌ Error processing {filename}: {str(e)}")
+            return False
+
+    def process_all_departments(self, departments=None):
+        """Process the rule breaking files (of the given departments only, if set) and upload to Google Sheets.
+        
+        Returns the number of departments whose percentage was written to their snapshot sheet.
+        """
         print("🚀 Starting Rule Breaking post-processing...")
         
         # Find all rule breaking files
         rule_breaking_files = self.find_rule_breaking_files()
         
+        # Keep only the requested departments
+        if departments is not None:
+            filtered_files = []
+            for filepath, dept_key, filename in rule_breaking_files:
+                dept_name = self.convert_dept_key_to_name(dept_key)
+                if dept_name in departments:
+                    filtered_files.append((filepath, dept_key, filename))
+                    print(f"📁 Will process: {filename} -> {dept_name}")
+                else:
+                    print(f"⏭️  Skipping: {filename} -> {dept_name} (not in requested departments)")
+            rule_breaking_files = filtered_files
+        
         if not rule_breaking_files:
             print("❌ No rule breaking files found")
-            return
+            return 0
         
         print(f"📁 Found {len(rule_breaking_files)} files to process")
         
-        success_count = 0
+        # Analysis is CPU-bound, so parse the files in parallel worker processes
+        max_workers = min(len(rule_breaking_files), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as process_pool:
+            all_results = list(process_pool.map(RuleBreakingProcessor.analyze_rule_breaking_data,
+                                                [filepath for filepath, _, _ in rule_breaking_files]))
         
-        for filepath, dept_key, filename in rule_breaking_files:
-            try:
-                print(f"\n📊 Processing {filename}...")
-                
-                # Analyze the data
-                analysis_results = self.analyze_rule_breaking_data(filepath)
-                if not analysis_results:
-                    continue
-                
-                # Create proper department name
-                # Handle prompt prefixes in filenames (mvr_, ccs_, mvs_, doc_, etc.)
-                dept_name = dept_key.replace('_', ' ').title()
-                
-                # Map prompt-prefixed department names to actual department names
-                if dept_name == 'Mvr Mv Resolvers':
-                    dept_name = 'MV Resolvers'
-                elif dept_name == 'Ccs Cc Sales':
-                    dept_name = 'CC Sales'
-                elif dept_name == 'Mvs Mv Sales':
-                    dept_name = 'MV Sales'
-                elif dept_name == 'Doc Doctors':
-                    dept_name = 'Doctors'
-                # Handle standard cases without prompt prefixes
-                elif dept_name == 'Cc Sales':
-                    dept_name = 'CC Sales'
-                elif dept_name == 'Cc Resolvers':
-                    dept_name = 'CC Resolvers'
-                elif dept_name == 'Mv Resolvers':
-                    dept_name = 'MV Resolvers'
-                elif dept_name == 'Mv Sales':
-                    dept_name = 'MV Sales'
-                
-                # Create summary report
-                output_filename = f"Rule_Breaking/{dept_name}_Rule_Breaking_Summary.csv"
-                percentage_ge_1 = self.create_summary_report(analysis_results, dept_name, output_filename)
-                
-                if percentage_ge_1 is not None:
-                    # Upload to Google Sheets
-                    if self.upload_to_google_sheets(dept_name, percentage_ge_1):
-                        success_count += 1
-                    
-            except Exception as e:
-                print(f"❌ Error processing {filename}: {str(e)}")
+        # Reports and Sheets lookups run here in the parent process, which holds the Sheets connection;
+        # read the headers and dates of every department sheet up front in batched requests
+        if self.service:
+            self.prefetch_sheet_contexts((self.department_sheets[self.convert_dept_key_to_name(dept_key)]
+                                          for _, dept_key, _ in rule_breaking_files
+                                          if self.convert_dept_key_to_name(dept_key) in self.department_sheets),
+                                         SNAPSHOT_TABS)
+        queued_departments = []
+        for (_, dept_key, filename), analysis_results in zip(rule_breaking_files, all_results):
+            dept_name = self.convert_dept_key_to_name(dept_key)
+            if self._process_department(dept_name, filename, analysis_results):
+                queued_departments.append(dept_name)
+        
+        # Write every queued cell in one batchUpdate per spreadsheet
+        flushed_sheet_ids = self.flush_writes()
+        success_count = sum(1 for dept_name in queued_departments
+                            if self.department_sheets[dept_name] in flushed_sheet_ids)
         
         # Print final summary
         print(f"\n📈 Processing Summary:")
         print(f"✅ Successfully processed and uploaded: {success_count}/{len(rule_breaking_files)} departments")
-        print(f"📁 Summary reports saved in: ./Rule_Breaking/")
+        print(f"📁 Summary reports saved in: {self.rule_breaking_dir}/")
+        return success_count
 
 def main():
     """Main function"""
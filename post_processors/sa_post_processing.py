@@ -1,102 +1,67 @@
 """
 Preprocessing and uploading to google sheets
 """
-import pandas as pd
+import numpy as np
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+from post_processors._llm_outputs import read_llm_output_column, scan_llm_outputs
+from post_processors._sheets import DEPARTMENT_SHEETS, index_to_column_letter
+from post_processors._sheets_base import SNAPSHOT_TABS, SnapshotSheetProcessor
 
-class SAPreprocessor:
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Upper bound on departments processed concurrently
+_MAX_WORKERS = 9
+
+# Weighted NPS formula weights for scores 0-5 (0 never occurs)
+_NPS_NUMERATOR_WEIGHTS = np.array([0, 2, 3, 3, 4, 10])
+_NPS_DENOMINATOR_WEIGHTS = np.array([0, 2, 1.5, 1, 1, 2])
+
+
+def parse_nps_score(llm_output_str):
+    """Return the NPS_score of one llm_output JSON object, or None if it cannot be parsed"""
+    try:
+        llm_output = _json_loads(llm_output_str)
+    except (json.JSONDecodeError, TypeError):  # orjson.JSONDecodeError subclasses json.JSONDecodeError
+        return None
+    return llm_output.get('NPS_score', 0) if isinstance(llm_output, dict) else None
+
+
+class SAPreprocessor(SnapshotSheetProcessor):
     def __init__(self, credentials_path='credentials.json'):
         """Initialize SA Preprocessor with Google Sheets integration"""
-        self.credentials_path = credentials_path
-        self.service = None
-        self.setup_sheets_api()
+        super().__init__(credentials_path)
         
-        # 9 Department Google Spreadsheet IDs - UPDATE WITH YOUR ACTUAL IDs
-        self.department_sheets = {
-            'Doctors': '1STHimb0IJ077iuBtTOwsa-GD8jStjU3SiBW7yBWom-E',
-            'Delighters': '1PV0ZmobUYKHGZvHC7IfJ1t6HrJMTFi6YRbpISCouIfQ',
-            'CC Sales': '1te1fbAXhURIUO0EzQ2Mrorv3a6GDtEVM_5np9TO775o',
-            'CC Resolvers': '1QdmaTc5F2VUJ0Yu0kNF9d6ETnkMOlOgi18P7XlBSyHg',  # CC Department
-            'Filipina': '1E5wHZKSDXQZlHIb3sV4ZWqIxvboLduzUEU0eupK7tys',
-            'African': '1__KlrVjcpR8RoYfTYMYZ_EgddUSXMhK3bJO0fTGwDig',
-            'Ethiopian': '1ENzdgiwUEtBSb5sHZJWs5aG8g2H62Low8doaDZf8s90',
-            'MV Resolvers': '1XkVcHlkh8fEp7mmBD1Zkavdp2blBLwSABT1dE_sOf74',
-            'MV Sales': '1agrl9hlBhemXkiojuWKbqiMHKUzxGgos4JSkXxw7NAk'
-        }
-
-    def setup_sheets_api(self):
-        """Setup Google Sheets API authentication"""
-        try:
-            SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-            
-            if os.path.exists(self.credentials_path):
-                creds = Credentials.from_service_account_file(
-                    self.credentials_path, scopes=SCOPES)
-                self.service = build('sheets', 'v4', credentials=creds)
-                print("✅ Google Sheets API authenticated successfully")
-                return True
-            else:
-                print(f"❌ Credentials file not found: {self.credentials_path}")
-                return False
-                
-        except Exception as e:
-            print(f"❌ Error setting up Google Sheets API: {str(e)}")
-            return False
-
-    def find_sentiment_analysis_column(self, sheet_id, sheet_name='Sheet1'):
-        """Find the column number for 'Sentiment Analysis' header"""
-        if not self.service:
-            print("❌ Google Sheets service not available")
-            return None
-            
-        # Try different sheet names - prioritize Data first
-        sheet_names_to_try = ['Data', sheet_name, 'Main']
+        # Yesterday's date, fixed once so a run crossing midnight keeps targeting the same day
+        self._yesterday = datetime.now() - timedelta(days=1)
+        self._date_mm_dd = self._yesterday.strftime('%m_%d')
+        self._date_iso = self._yesterday.strftime('%Y-%m-%d')
         
-        for current_sheet_name in sheet_names_to_try:
-            try:
-                print(f"🔍 Looking for 'Sentiment Analysis' column in sheet: {current_sheet_name}")
-                # Get the first row (header row) across a wide range
-                range_name = f"{current_sheet_name}!1:1"
-                result = self.service.spreadsheets().values().get(
-                    spreadsheetId=sheet_id, range=range_name).execute()
-                
-                values = result.get('values', [])
-                
-                if values and len(values) > 0:
-                    header_row = values[0]
-                    # Look for "Sentiment Analysis" in the header row
-                    for col_idx, header in enumerate(header_row):
-                        if header and "Sentiment Analysis" in str(header):
-                            column_number = col_idx + 1  # Convert to 1-based indexing
-                            print(f"✅ Found 'Sentiment Analysis' in column {column_number} (sheet: {current_sheet_name})")
-                            return column_number, current_sheet_name
-                
-                print(f"🔍 'Sentiment Analysis' column not found in sheet {current_sheet_name}")
-                
-            except Exception as e:
-                #print(f"❌ Error accessing sheet {current_sheet_name}: {str(e)}")
-                pass
+        # {(prompt, dept_key): (filepath, filename)} of yesterday's LLM outputs, scanned on first use
+        self._llm_outputs = None
         
-        print(f"❌ 'Sentiment Analysis' column not found in any sheet")
-        return None, None
+        # 9 Department Google Spreadsheet IDs
+        self.department_sheets = dict(DEPARTMENT_SHEETS)
 
     def calculate_weighted_nps(self, nps_scores):
         """Calculate weighted average using the specified formula"""
         if not nps_scores:
             return 0
             
-        # Count NPS scores 1-5
-        nps_counts = {i: nps_scores.count(i) for i in range(1, 6)}
+        # Count NPS scores 1-5 in one pass (index 0 is unused)
+        nps_counts = np.bincount(np.asarray(nps_scores, dtype=np.int64), minlength=6)[:6]
         
         # Apply weighted formula
-        numerator = (nps_counts[1]*2) + (nps_counts[2]*3) + (nps_counts[3]*3) + (nps_counts[4]*4) + (nps_counts[5]*10)
-        denominator = (nps_counts[1]*2) + (nps_counts[2]*1.5) + (nps_counts[3]*1) + (nps_counts[4]*1) + (nps_counts[5]*2)
+        numerator = _NPS_NUMERATOR_WEIGHTS @ nps_counts
+        denominator = _NPS_DENOMINATOR_WEIGHTS @ nps_counts
         
-        return numerator / denominator if denominator > 0 else 0
+        return float(numerator / denominator) if denominator > 0 else 0
 
     def extract_nps_from_file(self, filepath):
         """Extract NPS scores from llm_output column"""
@@ -105,22 +70,20 @@ class SAPreprocessor:
             return []
             
         try:
-            df = pd.read_csv(filepath)
-            nps_scores = []
+            llm_outputs = read_llm_output_column(filepath)
             
-            if 'llm_output' not in df.columns:
+            if llm_outputs is None:
                 print(f"❌ Column 'llm_output' not found in {filepath}")
                 return []
             
-            for _, row in df.iterrows():
-                try:
-                    llm_output_str = str(row['llm_output'])
-                    llm_output = json.loads(llm_output_str)
-                    nps_score = llm_output.get('NPS_score', 0)
-                    if isinstance(nps_score, int) and 1 <= nps_score <= 5:
-                        nps_scores.append(nps_score)
-                except (json.JSONDecodeError, KeyError, TypeError):
-                    continue
+            # Only JSON objects can hold an NPS_score, so skip blank and non-JSON rows before parsing
+            llm_outputs = llm_outputs.dropna().str.lstrip()
+            llm_outputs = llm_outputs[llm_outputs.str.startswith('{')]
+            
+            # Parse the remaining rows in one map, then filter to integer scores 1-5 with vectorized masks
+            scores = llm_outputs.astype(object).map(parse_nps_score)
+            scores = scores[scores.map(type).eq(int)].astype(int)
+            nps_scores = scores[scores.between(1, 5)].tolist()
                     
             print(f"✅ Extracted {len(nps_scores)} valid NPS scores from {filepath}")
             return nps_scores
@@ -129,92 +92,19 @@ class SAPreprocessor:
             print(f"❌ Error reading {filepath}: {str(e)}")
             return []
 
-    def find_date_row(self, sheet_id, target_date, sheet_name='Sheet1'):
-        """Find row with target date (2025-07-12 format) in column A"""
-        if not self.service:
-            print("❌ Google Sheets service not available")
-            return None, None
-            
-        # Try different sheet names - prioritize Data first
-        sheet_names_to_try = ['Data', sheet_name, 'Main']
-        
-        for current_sheet_name in sheet_names_to_try:
-            try:
-                print(f"🔍 Trying sheet: {current_sheet_name}")
-                # Get all data from column A
-                range_name = f"{current_sheet_name}!A:A"
-                result = self.service.spreadsheets().values().get(
-                    spreadsheetId=sheet_id, range=range_name).execute()
-                
-                values = result.get('values', [])
-                
-                # Find the row with target date
-                for i, row in enumerate(values):
-                    if row and len(row) > 0:
-                        cell_value = str(row[0]).strip()
-                        if target_date in cell_value:
-                            print(f"✅ Found date {target_date} in sheet {current_sheet_name}, row {i+1}")
-                            return i + 1, current_sheet_name  # Return both row and sheet name
-                
-                print(f"🔍 Date {target_date} not found in sheet {current_sheet_name}")
-                
-            except Exception as e:
-                #print(f"❌ Error accessing sheet {current_sheet_name}: {str(e)}")
-                pass
-        
-        print(f"❌ Date {target_date} not found in any sheet")
-        return None, None
-
-    def update_cell_value(self, sheet_id, sheet_name, row, col, value):
-        """Update a specific cell with the NPS value"""
-        if not self.service:
-            print("❌ Google Sheets service not available")
-            return False
-            
-        try:
-            # Convert column number to letter (1=A, 2=B, ..., 16=P, 17=Q)
-            if col <= 26:
-                col_letter = chr(64 + col)  # A-Z
-            else:
-                # For columns beyond Z (not needed here but good to have)
-                first_letter = chr(64 + ((col - 1) // 26))
-                second_letter = chr(64 + ((col - 1) % 26) + 1)
-                col_letter = first_letter + second_letter
-                
-            range_name = f"{sheet_name}!{col_letter}{row}"
-            
-            # Update the cell
-            body = {
-                'values': [[round(value, 2)]]
-            }
-            
-            result = self.service.spreadsheets().values().update(
-                spreadsheetId=sheet_id,
-                range=range_name,
-                valueInputOption='RAW',
-                body=body
-            ).execute()
-            
-            print(f"✅ Updated {range_name} with NPS: {round(value, 2)}")
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error updating cell: {str(e)}")
-            return False
-
     def update_department_nps(self, department):
         """Calculate and update NPS for a single department"""
         print(f"\n📊 Processing {department}...")
         
         try:
             # 1. Generate filepath: doctors_07_14.csv format
-            yesterday_date = (datetime.now() - timedelta(days=1)).strftime('%m_%d')
-            
             dept_name = department.lower().replace(' ', '_')
-            # Create path with date subfolder
-            yesterday = datetime.now() - timedelta(days=1)
-            date_folder = yesterday.strftime('%Y-%m-%d')
-            filepath = f"outputs/LLM_outputs/{date_folder}/saprompt_{dept_name}_{yesterday_date}.csv"
+            # Look the file up in the date subfolder index, falling back to the expected path
+            if self._llm_outputs is None:
+                self._llm_outputs = scan_llm_outputs(self._date_iso, self._date_mm_dd)
+            filepath, _ = self._llm_outputs.get(
+                ('saprompt', dept_name),
+                (f"outputs/LLM_outputs/{self._date_iso}/saprompt_{dept_name}_{self._date_mm_dd}.csv", None))
             
             # 2. Extract NPS scores from llm_output1 column
             nps_scores = self.extract_nps_from_file(filepath)
@@ -233,31 +123,31 @@ class SAPreprocessor:
                 return weighted_nps
                 
             # Find the column for 'Sentiment Analysis'
-            column_result = self.find_sentiment_analysis_column(sheet_id)
-            if not column_result or len(column_result) != 2:
-                print(f"❌ Could not find 'Sentiment Analysis' column for {department}")
+            if not self.service:
+                print("❌ Google Sheets service not available")
                 return weighted_nps
-                
-            column, found_sheet_name = column_result
+            column, found_sheet_name = self.find_header_column(sheet_id, 'Sentiment Analysis')
             if not column or not found_sheet_name:
                 print(f"❌ Could not find 'Sentiment Analysis' column for {department}")
                 return weighted_nps
             
-            # 5. Find row with yesterday's date (2025-07-13 format)
-            yesterday_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
-            date_row, found_sheet_name = self.find_date_row(sheet_id, yesterday_date)
+            # 5. Find row with yesterday's date (2025-07-13 format), trying the column's tab first
+            yesterday_date = self._date_iso
+            date_row, found_sheet_name = self.find_date_in_tabs(sheet_id, yesterday_date,
+                                                                (found_sheet_name,) + SNAPSHOT_TABS)
             
             if not date_row or not found_sheet_name:
                 print(f"❌ Could not find yesterday's date ({yesterday_date}) in {department} sheet")
                 return weighted_nps
             
-            # 6. Update the designated column with NPS score
-            success = self.update_cell_value(sheet_id, found_sheet_name, date_row, column, weighted_nps)
+            # 6. Queue the update of the designated column with NPS score
+            range_name = f"{found_sheet_name}!{index_to_column_letter(column - 1)}{date_row}"
+            success = self.update_cell_value(range_name, round(weighted_nps, 2), sheet_id=sheet_id)
             
             if success:
-                print(f"✅ Successfully updated {department} sheet")
+                print(f"✅ Queued {department} sheet update: {range_name} with NPS: {round(weighted_nps, 2)}")
             else:
-                print(f"❌ Failed to update {department} sheet")
+                print(f"❌ Failed to queue {department} sheet update")
                 
             return weighted_nps
             
@@ -276,14 +166,31 @@ class SAPreprocessor:
         results = {}
         success_count = 0
         
-        for department in self.department_sheets.keys():
-            nps = self.update_department_nps(department)
+        # Read the headers and dates of every department sheet up front in batched requests
+        # (cached columns are checked against the header rows)
+        self.prefetch_sheet_contexts(self.department_sheets.values(), SNAPSHOT_TABS)
+        
+        # Index yesterday's LLM output files with a single directory read
+        self._llm_outputs = scan_llm_outputs(self._date_iso, self._date_mm_dd)
+        
+        # Departments use independent sheets and mostly wait on Sheets I/O, so process them concurrently
+        departments = list(self.department_sheets.keys())
+        with ThreadPoolExecutor(max_workers=min(_MAX_WORKERS, len(departments))) as executor:
+            department_nps = list(executor.map(self.update_department_nps, departments))
+        
+        for department, nps in zip(departments, department_nps):
             if nps is not None:
                 results[department] = nps
                 success_count += 1
             else:
                 results[department] = None
         
+        # Write every queued cell update
+        flushed_sheet_ids = self.flush_writes()
+        for department, nps in results.items():
+            if nps is not None and self.department_sheets.get(department) in flushed_sheet_ids:
+                print(f"✅ Updated {department} sheet with NPS: {nps:.2f}")
+        
         # Print summary
         print(f"\n📈 Summary: Processed {success_count}/{len(self.department_sheets)} departments")
         print("\n📊 NPS Results:")
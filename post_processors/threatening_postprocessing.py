@@ -1,56 +1,124 @@
 import pandas as pd
-import os
-import glob
+import numpy as np
+import csv
 import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-from googleapiclient.discovery import build
-from google.oauth2.service_account import Credentials
+from post_processors._llm_outputs import ensure_output_dir, read_llm_output_column, scan_llm_outputs
+from post_processors._sheets import DEPARTMENT_NAMES, DEPARTMENT_SHEETS
+from post_processors._sheets_base import SnapshotSheetProcessor
 
-class ThreateningProcessor:
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pc = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+# Upper bound on departments processed concurrently
+_MAX_WORKERS = 9
+
+# Unparsable outputs quoted in a file's parse warning
+_PARSE_WARNING_SAMPLES = 3
+
+# First standalone true/false in an LLM output, in any case
+_TF_RE = re.compile(r'\b(true|false)\b', re.IGNORECASE)
+# The same pattern for Arrow's RE2 regex kernels
+_TF_ARROW_PATTERN = r'(?i)\b(?P<verdict>true|false)\b'
+
+# Files with at least this many rows are scanned by the compiled Numba kernel when available
+_NUMBA_MIN_ROWS = 1_000_000
+
+if njit is not None:
+    @njit(cache=True)
+    def _is_word_byte(byte):
+        """ASCII word character (like RE2's \\b, bytes of non-ASCII characters are not word characters)"""
+        return (48 <= byte <= 57) or (65 <= byte <= 90) or (97 <= byte <= 122) or byte == 95
+
+    @njit(cache=True)
+    def _matches_word(data, i, end, word):
+        """Whether the ASCII-lowercase bytes at data[i:] spell word and end at a word boundary"""
+        n = len(word)
+        if i + n > end:
+            return False
+        for k in range(n):
+            if data[i + k] | 32 != word[k]:
+                return False
+        return i + n == end or not _is_word_byte(data[i + n])
+
+    @njit(cache=True, parallel=True)
+    def _first_verdict_codes(data, offsets, true_word, false_word):
+        """Per row of a UTF-8 string buffer: 1 if its first standalone verdict is true, 0 if false, -1 if none"""
+        rows = len(offsets) - 1
+        codes = np.full(rows, -1, np.int8)
+        for row in prange(rows):
+            start, end = offsets[row], offsets[row + 1]
+            for i in range(start, end):
+                if i > start and _is_word_byte(data[i - 1]):
+                    continue
+                if _matches_word(data, i, end, true_word):
+                    codes[row] = 1
+                    break
+                if _matches_word(data, i, end, false_word):
+                    codes[row] = 0
+                    break
+        return codes
+
+
+def _numba_verdicts(outputs):
+    """first_verdicts() for very large columns: one compiled pass over the Arrow string buffers"""
+    strings = pa.array(outputs, type=pa.large_string())
+    _, offsets_buffer, data_buffer = strings.buffers()
+    offsets = np.frombuffer(offsets_buffer, dtype=np.int64)[strings.offset:strings.offset + len(strings) + 1]
+    data = np.frombuffer(data_buffer, dtype=np.uint8) if data_buffer is not None else np.zeros(0, np.uint8)
+    codes = _first_verdict_codes(data, offsets, np.frombuffer(b'true', np.uint8), np.frombuffer(b'false', np.uint8))
+    verdicts = np.array([None, 'false', 'true'], dtype=object)[codes + 1]
+    return pd.Series(verdicts, index=outputs.index, dtype='string')
+
+
+def first_verdicts(outputs):
+    """Lowercased first standalone true/false of each output string (NA where there is none)"""
+    if njit is not None and pc is not None and len(outputs) >= _NUMBA_MIN_ROWS:
+        return _numba_verdicts(outputs)
+    if pc is not None:
+        # Match and lowercase inside Arrow's C++ kernels, without building Python strings per row
+        matches = pc.extract_regex(pa.array(outputs, type=pa.string()), pattern=_TF_ARROW_PATTERN)
+        verdicts = pc.utf8_lower(pc.struct_field(matches, [0]))
+        return pd.Series(verdicts.to_numpy(zero_copy_only=False), index=outputs.index, dtype='string')
+    return outputs.str.extract(_TF_RE, expand=False).str.lower()
+
+
+class ThreateningProcessor(SnapshotSheetProcessor):
     def __init__(self, credentials_path='credentials.json'):
         """Initialize the threatening processor with Google Sheets API setup"""
-        self.credentials_path = credentials_path
-        self.service = None
-        self.setup_sheets_api()
-        # Snapshot sheet IDs for each department
+        super().__init__(credentials_path)
+        # Snapshot sheet IDs for each department, keyed like the filenames (cc_sales, mv_resolvers, ...)
         self.department_sheets = {
-            'doctors': '1STHimb0IJ077iuBtTOwsa-GD8jStjU3SiBW7yBWom-E',
-            'delighters': '1PV0ZmobUYKHGZvHC7IfJ1t6HrJMTFi6YRbpISCouIfQ',
-            'cc_sales': '1te1fbAXhURIUO0EzQ2Mrorv3a6GDtEVM_5np9TO775o',
-            'cc_resolvers': '1QdmaTc5F2VUJ0Yu0kNF9d6ETnkMOlOgi18P7XlBSyHg',
-            'filipina': '1E5wHZKSDXQZlHIb3sV4ZWqIxvboLduzUEU0eupK7tys',
-            'african': '1__KlrVjcpR8RoYfTYMYZ_EgddUSXMhK3bJO0fTGwDig',
-            'ethiopian': '1ENzdgiwUEtBSb5sHZJWs5aG8g2H62Low8doaDZf8s90',
-            'mv_resolvers': '1XkVcHlkh8fEp7mmBD1Zkavdp2blBLwSABT1dE_sOf74',
-            'mv_sales': '1agrl9hlBhemXkiojuWKbqiMHKUzxGgos4JSkXxw7NAk'
+            department.lower().replace(' ', '_'): sheet_id
+            for department, sheet_id in DEPARTMENT_SHEETS.items()
         }
         
+        # Run and target (yesterday's) dates, fixed once so a run crossing midnight keeps targeting the same day
+        now = datetime.now()
+        self._today_iso = now.strftime('%Y-%m-%d')
+        self._yesterday = now - timedelta(days=1)
+        self._date_mm_dd = self._yesterday.strftime('%m_%d')
+        self._date_iso = self._yesterday.strftime('%Y-%m-%d')
+        
         # Create output directory for summaries
-        yesterday = datetime.now() - timedelta(days=1)
-        date_folder = yesterday.strftime('%Y-%m-%d')
-        self.threatening_dir = f"outputs/threatening/{date_folder}"
-        os.makedirs(self.threatening_dir, exist_ok=True)
+        self.threatening_dir = f"outputs/threatening/{self._date_iso}"
+        ensure_output_dir(self.threatening_dir)
+        
+        # Department summary rows written together by write_summary_report()
+        self._summary_rows = []
+        self._summary_lock = threading.Lock()
     
-    def setup_sheets_api(self):
-        """Setup Google Sheets API connection"""
-        try:
-            if os.path.exists(self.credentials_path):
-                # Define the scope for Google Sheets API
-                SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-                
-                # Load credentials from the service account key file
-                creds = Credentials.from_service_account_file(self.credentials_path, scopes=SCOPES)
-                
-                # Build the service object for Sheets API
-                self.service = build('sheets', 'v4', credentials=creds)
-                print("✅ Google Sheets API initialized successfully")
-            else:
-                print(f"❌ Credentials file not found: {self.credentials_path}")
-                
-        except Exception as e:
-            print(f"❌ Error setting up Google Sheets API: {str(e)}")
-            self.service = None
-
     def safe_parse_output(self, llm_output_str):
         """Parse LLM output safely, handling various formats"""
         if pd.isna(llm_output_str) or not llm_output_str:
@@ -58,17 +126,10 @@ class ThreateningProcessor:
         
         output_str = str(llm_output_str).strip()
         
-        # Direct True/False values
-        if output_str.lower() == 'true':
-            return True
-        elif output_str.lower() == 'false':
-            return False
-        
-        # Handle cases where LLM might output additional text
-        if 'true' in output_str.lower():
-            return True
-        elif 'false' in output_str.lower():
-            return False
+        # Direct True/False values, or the first one in any additional text the LLM output
+        match = _TF_RE.search(output_str)
+        if match:
+            return match.group(1).lower() == 'true'
         
         print(f"⚠️ Could not parse LLM output: {output_str}")
         return None
@@ -76,28 +137,33 @@ class ThreateningProcessor:
     def calculate_threatening_percentage(self, filepath):
         """Calculate threatening percentage from LLM output file"""
         try:
-            # Read the CSV file
-            df = pd.read_csv(filepath)
+            # Read only the llm_output column of the CSV file
+            llm_outputs = read_llm_output_column(filepath)
+            
+            if llm_outputs is None:
+                print(f"⚠️ Column 'llm_output' not found in {filepath}")
+                return 0.0
             
-            if df.empty:
+            if llm_outputs.empty:
                 print(f"⚠️ Empty file: {filepath}")
                 return 0.0
             
-            total_conversations = 0
-            threatening_count = 0
-            parsing_errors = 0
+            # Same rule as safe_parse_output, applied to the whole column with one regex pass:
+            # the first standalone true/false decides each row
+            outputs = llm_outputs.fillna('').str.strip()
+            matches = first_verdicts(outputs)
+            is_true = matches == 'true'
+            unparsed = outputs[matches.isna()]
             
-            for index, row in df.iterrows():
-                llm_output = row.get('llm_output', '')
-                total_conversations += 1
-                
-                # Parse the LLM output
-                parsed_result = self.safe_parse_output(llm_output)
-                
-                if parsed_result is True:
-                    threatening_count += 1
-                elif parsed_result is None:
-                    parsing_errors += 1
+            # One warning per file instead of a print per unparsable row
+            unparsed_outputs = unparsed[unparsed != '']
+            if len(unparsed_outputs):
+                samples = '; '.join(output_str[:100] for output_str in unparsed_outputs.head(_PARSE_WARNING_SAMPLES))
+                print(f"⚠️ Could not parse {len(unparsed_outputs)} LLM output(s), e.g.: {samples}")
+            
+            total_conversations = len(outputs)
+            threatening_count = int(is_true.sum())
+            parsing_errors = len(unparsed)
             
             if total_conversations == 0:
                 return 0.0
@@ -117,17 +183,30 @@ class ThreateningProcessor:
             return 0.0
     
     def save_summary_report(self, percentage, dept_name):
-        """Save individual department threatening summary"""
+        """Add a department's threatening summary row (written by write_summary_report)"""
+        with self._summary_lock:
+            self._summary_rows.append({
+                'Department': dept_name,
+                'Threatening Percentage (%)': percentage,
+                'Date': self._today_iso
+            })
+        return True
+
+    def write_summary_report(self):
+        """Save the summary rows of every department to one threatening summary CSV"""
+        with self._summary_lock:
+            summary_rows = sorted(self._summary_rows, key=lambda row: row['Department'])
+            self._summary_rows = []
+        
+        if not summary_rows:
+            return False
+        
         try:
-            summary_data = {
-                'Department': [dept_name],
-                'Threatening Percentage (%)': [percentage],
-                'Date': [datetime.now().strftime('%Y-%m-%d')]
-            }
-            
-            summary_df = pd.DataFrame(summary_data)
-            output_filename = f"{self.threatening_dir}/{dept_name}_Threatening_Summary.csv"
-            summary_df.to_csv(output_filename, index=False)
+            output_filename = f"{self.threatening_dir}/Threatening_Summary.csv"
+            with open(output_filename, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=list(summary_rows[0]))
+                writer.writeheader()
+                writer.writerows(summary_rows)
             
             print(f"💾 Saved threatening summary: {output_filename}")
             return True
@@ -136,119 +215,6 @@ class ThreateningProcessor:
             print(f"❌ Error saving threatening summary: {str(e)}")
             return False
 
-    def index_to_column_letter(self, index):
-        """Convert 0-based column index to Google Sheets column letter (A, B, ..., Z, AA, AB, ...)"""
-        result = ""
-        while index >= 0:
-            result = chr(index % 26 + ord('A')) + result
-            index = index // 26 - 1
-        return result
-
-    def find_column_by_name(self, column_name, sheet_name='Data', sheet_id=None):
-        """Find column letter by exact column name with detailed debugging"""
-        try:
-            print(f"🔍 Searching for column '{column_name}' in headers...")
-            
-            # Check if we have a sheet ID to work with
-            if not sheet_id and not hasattr(self, 'snapshot_sheet_id'):
-                print("❌ No snapshot sheet ID configured")
-                return None
-            
-            # Use provided sheet_id or fall back to snapshot_sheet_id
-            spreadsheet_id = sheet_id if sheet_id else self.snapshot_sheet_id
-            
-            # Get the first row (headers)
-            range_name = f"{sheet_name}!1:1"
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=spreadsheet_id,
-                range=range_name
-            ).execute()
-            
-            headers = result.get('values', [[]])[0]
-            
-            # Try exact case-sensitive match first
-            for i, header in enumerate(headers):
-                if header == column_name:
-                    column_letter = self.index_to_column_letter(i)
-                    print(f"📍 Found exact match for '{column_name}' at column {column_letter}")
-                    return column_letter
-            
-            # Try exact case-insensitive match
-            for i, header in enumerate(headers):
-                if header.lower() == column_name.lower():
-                    column_letter = self.index_to_column_letter(i)
-                    print(f"📍 Found case-insensitive match for '{column_name}' at column {column_letter}")
-                    return column_letter
-            
-            print(f"❌ Column '{column_name}' not found in sheet headers")
-            return None
-            
-        except Exception as e:
-            print(f"❌ Error finding column: {str(e)}")
-            return None
-
-    def find_date_row(self, target_date, sheet_name='Data', sheet_id=None):
-        """Find the row number for a specific date"""
-        try:
-            # Check if we have a sheet ID to work with
-            if not sheet_id and not hasattr(self, 'snapshot_sheet_id'):
-                print("❌ No snapshot sheet ID configured")
-                return None
-            
-            # Use provided sheet_id or fall back to snapshot_sheet_id
-            spreadsheet_id = sheet_id if sheet_id else self.snapshot_sheet_id
-            
-            # Get all data from column A (assuming dates are in column A)
-            range_name = f"{sheet_name}!A:A"
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=spreadsheet_id,
-                range=range_name
-            ).execute()
-            
-            values = result.get('values', [])
-            target_date_str = target_date.strftime('%Y-%m-%d')
-            
-            for i, row in enumerate(values):
-                if row and len(row) > 0:
-                    cell_value = str(row[0]).strip()
-                    if cell_value == target_date_str:
-                        return i + 1, sheet_name  # Google Sheets is 1-indexed
-            
-            print(f"❌ Date {target_date_str} not found in column A")
-            return None, None
-            
-        except Exception as e:
-            print(f"❌ Error finding date row: {str(e)}")
-            return None, None
-
-    def update_cell_value(self, range_name, value, sheet_id=None):
-        """Update a specific cell with a value"""
-        try:
-            # Check if we have a sheet ID to work with
-            if not sheet_id and not hasattr(self, 'snapshot_sheet_id'):
-                print("❌ No snapshot sheet ID configured")
-                return False
-            
-            # Use provided sheet_id or fall back to snapshot_sheet_id
-            spreadsheet_id = sheet_id if sheet_id else self.snapshot_sheet_id
-            
-            body = {
-                'values': [[value]]
-            }
-            
-            result = self.service.spreadsheets().values().update(
-                spreadsheetId=spreadsheet_id,
-                range=range_name,
-                valueInputOption='RAW',
-                body=body
-            ).execute()
-            
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error updating cell {range_name}: {str(e)}")
-            return False
-
     def update_snapshot_sheet(self, percentage, dept_key):
         """Update threatening percentage in department snapshot sheet for yesterday's date"""
         try:
@@ -262,7 +228,7 @@ class ThreateningProcessor:
                 return False
                 
             sheet_id = self.department_sheets[dept_key]
-            yesterday = datetime.now() - timedelta(days=1)
+            yesterday = self._yesterday
             
             # Find the column for "Threatening Case Identifier"
             col_letter = self.find_column_by_name("Threatening Case Identifier", sheet_id=sheet_id)
@@ -273,16 +239,16 @@ class ThreateningProcessor:
             # Find the row for yesterday's date
             date_row, sheet_name = self.find_date_row(yesterday, sheet_id=sheet_id)
             if not date_row:
-                print(f"⚠️ Could not find date {yesterday.strftime('%Y-%m-%d')} in snapshot sheet")
+                print(f"⚠️ Could not find date {self._date_iso} in snapshot sheet")
                 return False
             
-            # Update the cell with threatening percentage
+            # Queue the cell update with threatening percentage
             range_name = f"{sheet_name}!{col_letter}{date_row}"
             success = self.update_cell_value(range_name, f"{percentage:.1f}%", sheet_id=sheet_id)
             
             if success:
-                dept_name = dept_key.replace('_', ' ').title()
-                print(f"📊 Updated {dept_name} snapshot sheet with threatening percentage: {percentage:.1f}%")
+                dept_name = DEPARTMENT_NAMES.get(dept_key, dept_key.replace('_', ' ').title())
+                print(f"📊 Queued {dept_name} snapshot sheet update with threatening percentage: {percentage:.1f}%")
             
             return success
             
@@ -292,24 +258,42 @@ class ThreateningProcessor:
 
     def find_threatening_files(self):
         """Find all threatening LLM output files"""
-        yesterday = datetime.now() - timedelta(days=1)
-        date_folder = yesterday.strftime('%Y-%m-%d')
-        date_str = yesterday.strftime('%m_%d')
+        # Look for threatening files in LLM_outputs (threatening_mv_resolvers_07_28.csv -> mv_resolvers)
+        llm_outputs = scan_llm_outputs(self._date_iso, self._date_mm_dd)
+        return [(filepath, dept_key, filename)
+                for (prompt, dept_key), (filepath, filename) in llm_outputs.items()
+                if prompt == 'threatening']
+
+    def _process_file(self, filepath, dept_key, filename):
+        """Calculate, save and queue one department's threatening percentage.
+        
+        Returns (dept_name, percentage, status, sheet_id) where status is 'queued',
+        'unconfigured' or 'failed', or None if the file could not be processed.
+        """
+        print(f"\n📊 Processing {filename}...")
+        
+        # Calculate percentage for this department
+        percentage = self.calculate_threatening_percentage(filepath)
+        
+        if percentage is None:
+            print(f"❌ Failed to process {filename}")
+            return None
+        
+        # Create proper department name (MV Resolvers, CC Sales, ...)
+        dept_name = DEPARTMENT_NAMES.get(dept_key, dept_key.replace('_', ' ').title())
         
-        # Look for threatening files in LLM_outputs
-        pattern = f"outputs/LLM_outputs/{date_folder}/threatening_*_{date_str}.csv"
-        files = glob.glob(pattern)
+        # Add this department's summary row
+        self.save_summary_report(percentage, dept_name)
         
-        result = []
-        for filepath in files:
-            filename = os.path.basename(filepath)
-            # Extract department key from filename: threatening_mv_resolvers_07_28.csv
-            parts = filename.replace('.csv', '').split('_')
-            if len(parts) >= 4 and parts[0] == 'threatening':
-                dept_key = '_'.join(parts[1:-2])  # Everything between 'threatening_' and '_MM_DD'
-                result.append((filepath, dept_key, filename))
+        # Update department snapshot sheet
+        if self.service and dept_key in self.department_sheets:
+            if self.update_snapshot_sheet(percentage, dept_key):
+                return dept_name, percentage, 'queued', self.department_sheets[dept_key]
+            print(f"⚠️  {dept_name}: {percentage}% threatening cases (failed to update snapshot)")
+            return dept_name, percentage, 'failed', None
         
-        return result
+        print(f"⚠️  {dept_name}: {percentage}% threatening cases (no snapshot sheet configured)")
+        return dept_name, percentage, 'unconfigured', None
 
     def process_all_files(self):
         """Process all threatening files and update snapshot"""
@@ -323,45 +307,32 @@ class ThreateningProcessor:
         
         print(f"📁 Found {len(files)} threatening file(s) to process")
         
-        successful_files = 0
+        # Read the headers and dates of every snapshot sheet up front in one batched request
+        # (cached columns are checked against the header rows)
+        if self.service:
+            self.prefetch_sheet_contexts(self.department_sheets[dept_key] for _, dept_key, _ in files
+                                         if dept_key in self.department_sheets)
         
-        for filepath, dept_key, filename in files:
-            print(f"\n📊 Processing {filename}...")
-            
-            # Calculate percentage for this department
-            percentage = self.calculate_threatening_percentage(filepath)
-            
-            if percentage is not None:
-                # Create proper department name
-                dept_name = dept_key.replace('_', ' ').title()
-                
-                # Handle specific department name mappings
-                if dept_name == 'Mv Resolvers':
-                    dept_name = 'MV Resolvers'
-                elif dept_name == 'Mv Sales':
-                    dept_name = 'MV Sales'
-                elif dept_name == 'Cc Sales':
-                    dept_name = 'CC Sales'
-                elif dept_name == 'Cc Resolvers':
-                    dept_name = 'CC Resolvers'
-                
-                # Save individual summary
-                self.save_summary_report(percentage, dept_name)
-                
-                # Update department snapshot sheet
-                if self.service and dept_key in self.department_sheets:
-                    update_success = self.update_snapshot_sheet(percentage, dept_key)
-                    if update_success:
-                        successful_files += 1
-                        print(f"✅ {dept_name}: {percentage}% threatening cases (snapshot updated)")
-                    else:
-                        print(f"⚠️  {dept_name}: {percentage}% threatening cases (failed to update snapshot)")
-                else:
-                    print(f"⚠️  {dept_name}: {percentage}% threatening cases (no snapshot sheet configured)")
-                    successful_files += 1
-            
+        # Files are independent and mostly wait on disk/Sheets I/O, so process them concurrently
+        with ThreadPoolExecutor(max_workers=min(_MAX_WORKERS, len(files))) as executor:
+            futures = [executor.submit(self._process_file, filepath, dept_key, filename)
+                       for filepath, dept_key, filename in files]
+            results = [future.result() for future in as_completed(futures)]
+        
+        # One summary CSV for all departments
+        self.write_summary_report()
+        
+        successful_files = sum(1 for result in results if result and result[2] == 'unconfigured')
+        queued_updates = [result for result in results if result and result[2] == 'queued']
+        
+        # Write every queued snapshot update, one batchUpdate per spreadsheet
+        flushed_sheet_ids = self.flush_writes() if queued_updates else set()
+        for dept_name, percentage, _, sheet_id in queued_updates:
+            if sheet_id in flushed_sheet_ids:
+                successful_files += 1
+                print(f"✅ {dept_name}: {percentage}% threatening cases (snapshot updated)")
             else:
-                print(f"❌ Failed to process {filename}")
+                print(f"⚠️  {dept_name}: {percentage}% threatening cases (failed to update snapshot)")
         
         # Summary of processing
         if successful_files > 0:
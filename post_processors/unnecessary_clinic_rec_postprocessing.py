@@ -1,47 +1,53 @@
 import pandas as pd
-import os
-import glob
+import csv
 import json
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from googleapiclient.discovery import build
-from google.oauth2.service_account import Credentials
+from post_processors._llm_outputs import ensure_output_dir, read_llm_output_column, scan_llm_outputs
+from post_processors._sheets import DEPARTMENT_NAMES
+from post_processors._sheets_base import SnapshotSheetProcessor
 
-class UnnecessaryClinicRecProcessor:
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Upper bound on departments processed concurrently
+_MAX_WORKERS = 9
+
+# Unparsable outputs quoted in a file's parse warning
+_PARSE_WARNING_SAMPLES = 3
+
+# could_avoid_visit flag of a JSON LLM output, read without parsing the whole object
+_COULD_AVOID_RE = re.compile(r'"could_avoid_visit"\s*:\s*(true|false)\b')
+
+
+class UnnecessaryClinicRecProcessor(SnapshotSheetProcessor):
     def __init__(self, credentials_path='credentials.json'):
         """Initialize the unnecessary clinic rec processor with Google Sheets API setup"""
-        self.credentials_path = credentials_path
-        self.service = None
-        self.setup_sheets_api()
+        super().__init__(credentials_path)
         self.snapshot_sheet_id = '1STHimb0IJ077iuBtTOwsa-GD8jStjU3SiBW7yBWom-E'
         
+        # Run and target (yesterday's) dates, fixed once so a run crossing midnight keeps targeting the same day
+        now = datetime.now()
+        self._today_iso = now.strftime('%Y-%m-%d')
+        self._yesterday = now - timedelta(days=1)
+        self._date_mm_dd = self._yesterday.strftime('%m_%d')
+        self._date_iso = self._yesterday.strftime('%Y-%m-%d')
+        
         # Create output directory for summaries
-        yesterday = datetime.now() - timedelta(days=1)
-        date_folder = yesterday.strftime('%Y-%m-%d')
-        self.output_dir = f"outputs/unnecessary_clinic_rec/{date_folder}"
-        os.makedirs(self.output_dir, exist_ok=True)
+        self.output_dir = f"outputs/unnecessary_clinic_rec/{self._date_iso}"
+        ensure_output_dir(self.output_dir)
+        
+        # Department summary rows written together by write_summary_report()
+        self._summary_rows = []
+        self._summary_lock = threading.Lock()
     
-    def setup_sheets_api(self):
-        """Setup Google Sheets API connection"""
-        try:
-            if os.path.exists(self.credentials_path):
-                # Define the scope for Google Sheets API
-                SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-                
-                # Load credentials from the service account key file
-                creds = Credentials.from_service_account_file(self.credentials_path, scopes=SCOPES)
-                
-                # Build the service object for Sheets API
-                self.service = build('sheets', 'v4', credentials=creds)
-                print("✅ Google Sheets API initialized successfully")
-            else:
-                print(f"❌ Credentials file not found: {self.credentials_path}")
-                
-        except Exception as e:
-            print(f"❌ Error setting up Google Sheets API: {str(e)}")
-            self.service = None
-
-    def safe_json_parse(self, json_str):
-        """Safely parse JSON string from LLM output"""
+    def safe_json_parse(self, json_str, quiet=False):
+        """Safely parse JSON string from LLM output (quiet skips the per-row error print)"""
         try:
             if pd.isna(json_str) or not json_str.strip():
                 return None
@@ -58,41 +64,52 @@ class UnnecessaryClinicRecProcessor:
             elif cleaned.startswith('```') and cleaned.endswith('```'):
                 cleaned = cleaned.replace('```', '').strip()
             
-            return json.loads(cleaned)
-        except json.JSONDecodeError as e:
-            print(f"⚠️ JSON decode error for: {str(json_str)[:100]}... Error: {e}")
+            return _json_loads(cleaned)
+        except json.JSONDecodeError as e:  # orjson.JSONDecodeError subclasses json.JSONDecodeError
+            if not quiet:
+                print(f"⚠️ JSON decode error for: {str(json_str)[:100]}... Error: {e}")
             return None
         except Exception as e:
-            print(f"⚠️ Unexpected error parsing: {str(json_str)[:100]}... Error: {e}")
+            if not quiet:
+                print(f"⚠️ Unexpected error parsing: {str(json_str)[:100]}... Error: {e}")
             return None
     
     def calculate_unnecessary_clinic_percentage(self, filepath):
         """Calculate unnecessary clinic recommendation percentage from LLM output file"""
         try:
-            # Read the CSV file
-            df = pd.read_csv(filepath)
+            # Read only the llm_output column of the CSV file
+            llm_outputs = read_llm_output_column(filepath)
+            
+            if llm_outputs is None:
+                print(f"⚠️ Column 'llm_output' not found in {filepath}")
+                return 0.0, 0, 0
             
-            if df.empty:
+            if llm_outputs.empty:
                 print(f"⚠️ Empty file: {filepath}")
                 return 0.0, 0, 0
             
-            total_conversations = 0
-            could_avoid_count = 0
-            parsing_errors = 0
+            outputs = llm_outputs.fillna('')
+            
+            # Read the flag of every row with one vectorized regex pass
+            flags = outputs.str.extract(_COULD_AVOID_RE, expand=False)
+            
+            # Only rows without the flag need a full parse, to tell JSON lacking it from unparsable output
+            unflagged = outputs[flags.isna()]
+            parsed_results = unflagged.astype(object).map(lambda output: self.safe_json_parse(output, quiet=True))
+            parsed_ok = parsed_results.map(lambda parsed: isinstance(parsed, dict) and bool(parsed)).astype(bool)
+            parsed_could_avoid = parsed_results[parsed_ok].map(
+                lambda parsed: parsed.get('could_avoid_visit') is True).astype(bool)
+            
+            total_conversations = len(outputs)
+            could_avoid_count = int((flags == 'true').sum()) + int(parsed_could_avoid.sum())
+            parsing_errors = int((~parsed_ok).sum())
             
-            for index, row in df.iterrows():
-                llm_output = row.get('llm_output', '')
-                total_conversations += 1
-                
-                # Parse the JSON output
-                parsed_result = self.safe_json_parse(llm_output)
-                
-                if parsed_result:
-                    could_avoid_visit = parsed_result.get('could_avoid_visit', False)
-                    if could_avoid_visit is True:
-                        could_avoid_count += 1
-                else:
-                    parsing_errors += 1
+            # One warning per file instead of a print per unparsable row
+            unparsed = unflagged[~parsed_ok]
+            unparsed = unparsed[unparsed.str.strip() != '']
+            if len(unparsed):
+                samples = '; '.join(output[:100] for output in unparsed.head(_PARSE_WARNING_SAMPLES))
+                print(f"⚠️ Could not parse {len(unparsed)} LLM output(s), e.g.: {samples}")
             
             if total_conversations == 0:
                 return 0.0, 0, 0
@@ -112,17 +129,30 @@ class UnnecessaryClinicRecProcessor:
             return 0.0, 0, 0
     
     def save_summary_report(self, percentage, dept_name):
-        """Save individual department unnecessary clinic rec summary"""
+        """Add a department's unnecessary clinic rec summary row (written by write_summary_report)"""
+        with self._summary_lock:
+            self._summary_rows.append({
+                'Department': dept_name,
+                'Unnecessary Clinic Rec Percentage (%)': percentage,
+                'Date': self._today_iso
+            })
+        return True
+
+    def write_summary_report(self):
+        """Save the summary rows of every department to one unnecessary clinic rec summary CSV"""
+        with self._summary_lock:
+            summary_rows = sorted(self._summary_rows, key=lambda row: row['Department'])
+            self._summary_rows = []
+        
+        if not summary_rows:
+            return False
+        
         try:
-            summary_data = {
-                'Department': [dept_name],
-                'Unnecessary Clinic Rec Percentage (%)': [percentage],
-                'Date': [datetime.now().strftime('%Y-%m-%d')]
-            }
-            
-            summary_df = pd.DataFrame(summary_data)
-            output_filename = f"{self.output_dir}/{dept_name}_Unnecessary_Clinic_Rec_Summary.csv"
-            summary_df.to_csv(output_filename, index=False)
+            output_filename = f"{self.output_dir}/Unnecessary_Clinic_Rec_Summary.csv"
+            with open(output_filename, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=list(summary_rows[0]))
+                writer.writeheader()
+                writer.writerows(summary_rows)
             
             print(f"💾 Saved unnecessary clinic rec summary: {output_filename}")
             return True
@@ -131,97 +161,6 @@ class UnnecessaryClinicRecProcessor:
             print(f"❌ Error saving unnecessary clinic rec summary: {str(e)}")
             return False
 
-    def index_to_column_letter(self, index):
-        """Convert 0-based column index to Google Sheets column letter (A, B, ..., Z, AA, AB, ...)"""
-        result = ""
-        while index >= 0:
-            result = chr(index % 26 + ord('A')) + result
-            index = index // 26 - 1
-        return result
-
-    def find_column_by_name(self, column_name, sheet_name='Data'):
-        """Find column letter by exact column name with detailed debugging"""
-        try:
-            print(f"🔍 Searching for column '{column_name}' in headers...")
-            
-            # Get the first row (headers)
-            range_name = f"{sheet_name}!1:1"
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.snapshot_sheet_id,
-                range=range_name
-            ).execute()
-            
-            headers = result.get('values', [[]])[0]
-            
-            # Try exact case-sensitive match first
-            for i, header in enumerate(headers):
-                if header == column_name:
-                    column_letter = self.index_to_column_letter(i)
-                    print(f"📍 Found exact match for '{column_name}' at column {column_letter}")
-                    return column_letter
-            
-            # Try exact case-insensitive match
-            for i, header in enumerate(headers):
-                if header.lower() == column_name.lower():
-                    column_letter = self.index_to_column_letter(i)
-                    print(f"📍 Found case-insensitive match for '{column_name}' at column {column_letter}")
-                    return column_letter
-            
-            print(f"❌ Column '{column_name}' not found in sheet headers")
-            return None
-            
-        except Exception as e:
-            print(f"❌ Error finding column: {str(e)}")
-            return None
-
-    def find_date_row(self, target_date, sheet_name='Data'):
-        """Find the row number for a specific date"""
-        try:
-            # Get all data from column A (assuming dates are in column A)
-            range_name = f"{sheet_name}!A:A"
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.snapshot_sheet_id,
-                range=range_name
-            ).execute()
-            
-            values = result.get('values', [])
-            target_date_str = target_date.strftime('%Y-%m-%d')
-            
-            for i, row in enumerate(values):
-                if row and len(row) > 0:
-                    cell_value = str(row[0]).strip()
-                    if cell_value == target_date_str:
-                        print(f"✅ Found date {target_date_str} in row {i + 1}")
-                        return i + 1  # Google Sheets is 1-indexed
-            
-            print(f"❌ Date {target_date_str} not found in column A")
-            return None
-            
-        except Exception as e:
-            print(f"❌ Error finding date row: {str(e)}")
-            return None
-
-    def update_cell_value(self, range_name, value):
-        """Update a specific cell with a value"""
-        try:
-            body = {
-                'values': [[value]]
-            }
-            
-            result = self.service.spreadsheets().values().update(
-                spreadsheetId=self.snapshot_sheet_id,
-                range=range_name,
-                valueInputOption='RAW',
-                body=body
-            ).execute()
-            
-            print(f"✅ Updated {range_name} with value: {value}")
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error updating cell {range_name}: {str(e)}")
-            return False
-
     def update_snapshot_sheet(self, percentage, count, total):
         """Update unnecessary clinic rec count and percentage in snapshot sheet for yesterday's date"""
         try:
@@ -229,7 +168,7 @@ class UnnecessaryClinicRecProcessor:
                 print("❌ Google Sheets API not available")
                 return False
             
-            yesterday = datetime.now() - timedelta(days=1)
+            yesterday = self._yesterday
             
             # Find the column for "Unnecessary clinic recommendations"
             col_letter = self.find_column_by_name("Unnecessary clinic recommendations")
@@ -238,18 +177,19 @@ class UnnecessaryClinicRecProcessor:
                 return False
             
             # Find the row for yesterday's date
-            date_row = self.find_date_row(yesterday)
+            date_row, sheet_name = self.find_date_row(yesterday)
             if not date_row:
-                print(f"⚠️ Could not find date {yesterday.strftime('%Y-%m-%d')} in snapshot sheet")
+                print(f"⚠️ Could not find date {self._date_iso} in snapshot sheet")
                 return False
             
             # Update the cell with unnecessary clinic rec count and percentage
-            range_name = f"Data!{col_letter}{date_row}"
+            range_name = f"{sheet_name}!{col_letter}{date_row}"
             value = f"{count} ({percentage}% of clinics recommended)"
-            success = self.update_cell_value(range_name, value)
+            success = (self.update_cell_value(range_name, value)
+                       and self.snapshot_sheet_id in self.flush_writes())
             
             if success:
-                print(f"📊 Updated snapshot sheet with unnecessary clinic rec: {count} ({percentage}%) for {yesterday.strftime('%Y-%m-%d')}")
+                print(f"📊 Updated snapshot sheet with unnecessary clinic rec: {count} ({percentage}%) for {self._date_iso}")
             
             return success
             
@@ -259,24 +199,36 @@ class UnnecessaryClinicRecProcessor:
 
     def find_unnecessary_clinic_rec_files(self):
         """Find all unnecessary clinic rec LLM output files"""
-        yesterday = datetime.now() - timedelta(days=1)
-        date_folder = yesterday.strftime('%Y-%m-%d')
-        date_str = yesterday.strftime('%m_%d')
+        # Look for unnecessary clinic rec files in LLM_outputs (unnecessary_clinic_rec_doctors_07_29.csv -> doctors)
+        llm_outputs = scan_llm_outputs(self._date_iso, self._date_mm_dd)
+        return [(filepath, dept_key, filename)
+                for (prompt, dept_key), (filepath, filename) in llm_outputs.items()
+                if prompt == 'unnecessary_clinic_rec']
+
+    def _process_file(self, filepath, dept_key, filename):
+        """Calculate and save one department's unnecessary clinic rec percentage.
+        
+        Returns (dept_name, percentage, count, conversations), or None if the file could not be processed.
+        """
+        print(f"\n📊 Processing {filename}...")
         
-        # Look for unnecessary clinic rec files in LLM_outputs
-        pattern = f"outputs/LLM_outputs/{date_folder}/unnecessary_clinic_rec_*_{date_str}.csv"
-        files = glob.glob(pattern)
+        # Calculate percentage for this department
+        result = self.calculate_unnecessary_clinic_percentage(filepath)
+        
+        if not result or result[0] is None:
+            print(f"❌ Failed to process {filename}")
+            return None
         
-        result = []
-        for filepath in files:
-            filename = os.path.basename(filepath)
-            # Extract department key from filename: unnecessary_clinic_rec_doctors_07_29.csv
-            parts = filename.replace('.csv', '').split('_')
-            if len(parts) >= 5 and parts[0] == 'unnecessary' and parts[1] == 'clinic' and parts[2] == 'rec':
-                dept_key = '_'.join(parts[3:-2])  # Everything between 'unnecessary_clinic_rec_' and '_MM_DD'
-                result.append((filepath, dept_key, filename))
+        percentage, count, conversations = result
         
-        return result
+        # Create proper department name
+        dept_name = DEPARTMENT_NAMES.get(dept_key, dept_key.replace('_', ' ').title())
+        
+        # Add this department's summary row
+        self.save_summary_report(percentage, dept_name)
+        
+        print(f"✅ {dept_name}: {count} ({percentage}%) unnecessary clinic recommendations")
+        return dept_name, percentage, count, conversations
 
     def process_all_files(self):
         """Process all unnecessary clinic rec files and update snapshot"""
@@ -295,34 +247,20 @@ class UnnecessaryClinicRecProcessor:
         total_conversations = 0
         successful_files = 0
         
-        for filepath, dept_key, filename in files:
-            print(f"\n📊 Processing {filename}...")
-            
-            # Calculate percentage for this department
-            result = self.calculate_unnecessary_clinic_percentage(filepath)
-            
-            if result and result[0] is not None:
-                percentage, count, conversations = result
-                
-                # Create proper department name
-                dept_name = dept_key.replace('_', ' ').title()
-                
-                # Handle specific department name mappings
-                if dept_name == 'Doctors':
-                    dept_name = 'Doctors'
-                
-                # Save individual summary
-                self.save_summary_report(percentage, dept_name)
-                
+        # Files are independent and mostly wait on disk I/O, so process them concurrently
+        with ThreadPoolExecutor(max_workers=min(_MAX_WORKERS, len(files))) as executor:
+            results = list(executor.map(lambda file: self._process_file(*file), files))
+        
+        # One summary CSV for all departments
+        self.write_summary_report()
+        
+        for result in results:
+            if result:
+                _, percentage, count, conversations = result
                 total_percentage += percentage
                 total_count += count
                 total_conversations += conversations
                 successful_files += 1
-                
-                print(f"✅ {dept_name}: {count} ({percentage}%) unnecessary clinic recommendations")
-            
-            else:
-                print(f"❌ Failed to process {filename}")
         
         # Update snapshot sheet with average percentage if we have data
         if successful_files > 0:
@@ -1,31 +1,115 @@
+import csv
+import gzip
+import logging
 import os
-import pandas as pd
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from datetime import datetime, timedelta
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from post_processors._llm_outputs import scan_llm_outputs
+from post_processors._sheets import DEPARTMENT_NAMES, execute, get_cached_lookup, get_sheets_service, remember_lookup
+
+# Progress lines go through a logger, whose handler lock keeps concurrent uploads' lines whole
+logger = logging.getLogger(__name__)
+
+# Google Sheets cell limit; longer values are truncated
+CELL_CHAR_LIMIT = 50000
+
+# Rows written per request, keeping each body well under the Sheets request size limit
+UPLOAD_CHUNK_ROWS = 10000
+
+# With gzip uploads enabled, request bodies at least this large are gzipped;
+# LLM output text compresses several times over
+GZIP_MIN_BYTES = 4096
+
+# Statuses the Sheets API would answer a Content-Encoding it does not accept with;
+# a gzipped write rejected with one of these is resent uncompressed
+GZIP_REJECTED_STATUSES = (400, 415)
+
+# Upper bound on departments uploaded concurrently
+_MAX_WORKERS = 8
+
+
+def _clean(value):
+    """Clean a cell value to prevent JSON parsing errors while preserving linebreaks"""
+    # Keep linebreaks but normalize them to \n for Google Sheets (most cells, e.g. numbers and IDs, have no \r)
+    if '\r' in value:
+        value = value.replace('\r\n', '\n').replace('\r', '\n')
+    # Truncate very long values that might cause issues
+    if len(value) > CELL_CHAR_LIMIT:
+        value = value[:CELL_CHAR_LIMIT] + "..."
+    return value
+
+
+def gzip_body(request):
+    """Gzip a Sheets API request's JSON body (sent with Content-Encoding: gzip) once it is large enough to pay off"""
+    body = request.body
+    if body and len(body) >= GZIP_MIN_BYTES:
+        request.body = gzip.compress(body.encode('utf-8') if isinstance(body, str) else body)
+        # execute() sends body_size as the Content-Length
+        request.body_size = len(request.body)
+        request.headers['content-encoding'] = 'gzip'
+    return request
+
+
+def execute_gzipped(request):
+    """Execute a Sheets API write with its body gzipped, resending it uncompressed if the API rejects the encoding"""
+    body, body_size, headers = request.body, request.body_size, dict(request.headers)
+    gzip_body(request)
+    if request.body is body:
+        # Too small to be worth compressing
+        return execute(request)
+    
+    try:
+        return execute(request)
+    except HttpError as e:
+        if e.resp.status not in GZIP_REJECTED_STATUSES:
+            raise
+        logger.warning("⚠️ Sheets API rejected a gzipped request body (HTTP %s), resending it uncompressed",
+                       e.resp.status)
+        request.body, request.body_size, request.headers = body, body_size, headers
+        return execute(request)
+
+
+def read_sheet_values(filepath):
+    """Read a CSV straight into the header + cleaned rows uploaded to a sheet.
+    
+    Cells stay as the text in the file, so no DataFrame (and second copy of the data) is built.
+    """
+    with open(filepath, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        values = [next(reader, [])]
+        # Rows are cleaned as they are read, so the file's data is only ever held once
+        values.extend([_clean(cell) for cell in row] for row in reader)
+    return values
+
 
 class CallRequestUploader:
-    def __init__(self, credentials_path='credentials.json'):
+    def __init__(self, credentials_path='credentials.json', gzip_uploads=False):
+        """gzip_uploads sends large data writes gzipped (opt-in; falls back to uncompressed if rejected)"""
         self.credentials_path = credentials_path
+        self.gzip_uploads = gzip_uploads
         self.service = None
         self.setup_sheets_api()
         
-        # Department sheets mapping - currently only MV Resolvers has a sheet
+        # Department sheets mapping, keyed like the filenames - currently only MV Resolvers has a sheet
         self.department_sheets = {
-            'MV Resolvers': '1uer1eNI-RhqY6jnkdpNkhUecISMNNQLGAlGaeVCWmiA',
+            'mv_resolvers': '1uer1eNI-RhqY6jnkdpNkhUecISMNNQLGAlGaeVCWmiA',
         }
+        
+        # Sheet IDs of the sheets added during this run, keyed by (spreadsheet ID, sheet name)
+        self._created_sheets = {}
     
     def setup_sheets_api(self):
         """Initialize Google Sheets API service"""
         try:
-            credentials = Credentials.from_service_account_file(
-                self.credentials_path,
-                scopes=['https://www.googleapis.com/auth/spreadsheets']
-            )
-            self.service = build('sheets', 'v4', credentials=credentials)
-            print("✅ Google Sheets API initialized successfully")
+            # Shared service; execute() gives each upload thread its own connection
+            self.service = get_sheets_service(self.credentials_path)
+            logger.info("✅ Google Sheets API initialized successfully")
         except Exception as e:
-            print(f"❌ Error setting up Google Sheets API: {str(e)}")
+            logger.error("❌ Error setting up Google Sheets API: %s", e)
             self.service = None
     
     def create_new_sheet(self, spreadsheet_id, sheet_name):
@@ -41,71 +125,160 @@ class CallRequestUploader:
                 }]
             }
             
-            response = self.service.spreadsheets().batchUpdate(
+            response = execute(self.service.spreadsheets().batchUpdate(
                 spreadsheetId=spreadsheet_id,
                 body=request_body
-            ).execute()
+            ))
             
-            print(f"✅ Created new sheet: {sheet_name}")
+            # A sheet added this run is empty, so its upload can skip the clear
+            properties = response['replies'][0]['addSheet']['properties']
+            self._created_sheets[(spreadsheet_id, sheet_name)] = properties['sheetId']
+            
+            logger.info("✅ Created new sheet: %s", sheet_name)
             return True
             
         except Exception as e:
             if "already exists" in str(e).lower():
-                print(f"📄 Sheet '{sheet_name}' already exists")
+                logger.info("📄 Sheet '%s' already exists", sheet_name)
                 return True
             else:
-                print(f"❌ Error creating sheet {sheet_name}: {str(e)}")
+                logger.error("❌ Error creating sheet %s: %s", sheet_name, e)
                 return False
     
-    def upload_data_to_sheet(self, spreadsheet_id, sheet_name, df):
-        """Upload DataFrame to Google Sheet with proper data cleaning"""
-        try:
-            def clean_cell_value(value):
-                """Clean cell values to prevent JSON parsing errors while preserving linebreaks"""
-                if pd.isna(value):
-                    return ""
-                value_str = str(value)
-                # Keep linebreaks but normalize them to \n for Google Sheets
-                value_str = value_str.replace('\r\n', '\n').replace('\r', '\n')
-                # Truncate very long values that might cause issues
-                if len(value_str) > 50000:  # Google Sheets cell limit
-                    value_str = value_str[:50000] + "..."
-                return value_str
-            
-            # Clean the DataFrame before converting to values
-            cleaned_df = df.copy()
-            for column in cleaned_df.columns:
-                cleaned_df[column] = cleaned_df[column].apply(clean_cell_value)
-            
-            # Prepare cleaned data for upload
-            values = [cleaned_df.columns.tolist()] + cleaned_df.values.tolist()
-            
-            # Clear existing content first
-            clear_range = f"{sheet_name}!A:Z"
-            self.service.spreadsheets().values().clear(
-                spreadsheetId=spreadsheet_id,
-                range=clear_range
-            ).execute()
-            
-            # Upload new data
-            body = {
-                'values': values
+    def _execute_write(self, request):
+        """Execute a data write, gzipped if gzip uploads are enabled"""
+        return execute_gzipped(request) if self.gzip_uploads else execute(request)
+    
+    @staticmethod
+    def _update_cells_request(sheet_id, row_index, rows):
+        """Build an updateCells request writing rows of cell strings starting at a 0-based row"""
+        # The first chunk targets the whole sheet, so any old cells past the new data are cleared
+        target = ({'range': {'sheetId': sheet_id}} if row_index == 0 else
+                  {'start': {'sheetId': sheet_id, 'rowIndex': row_index, 'columnIndex': 0}})
+        return {
+            'updateCells': {
+                **target,
+                'rows': [
+                    {'values': [{'userEnteredValue': {'stringValue': value}} for value in row]}
+                    for row in rows
+                ],
+                'fields': 'userEnteredValue'
             }
+        }
+    
+    def _write_rows(self, spreadsheet_id, sheet_id, values, first_request):
+        """Write values to a sheet by ID, UPLOAD_CHUNK_ROWS rows per spreadsheets.batchUpdate.
+        
+        first_request (adding or resizing the sheet) goes in the same batch as the first chunk.
+        """
+        for start in range(0, len(values), UPLOAD_CHUNK_ROWS):
+            requests = [self._update_cells_request(sheet_id, start, values[start:start + UPLOAD_CHUNK_ROWS])]
+            if start == 0:
+                requests.insert(0, first_request)
             
-            range_name = f"{sheet_name}!A1"
-            result = self.service.spreadsheets().values().update(
+            self._execute_write(self.service.spreadsheets().batchUpdate(
                 spreadsheetId=spreadsheet_id,
-                range=range_name,
-                valueInputOption='RAW',
-                body=body
-            ).execute()
+                body={'requests': requests}
+            ))
+    
+    @staticmethod
+    def _grid_properties(values):
+        """Grid size fitting all the rows, so every chunk lands inside the sheet"""
+        return {
+            'rowCount': len(values),
+            'columnCount': max(len(row) for row in values)
+        }
+    
+    def upload_via_batch(self, spreadsheet_id, sheet_name, values):
+        """Add a new sheet and write its data in a single spreadsheets.batchUpdate.
+        
+        Data past UPLOAD_CHUNK_ROWS rows follows in one more batchUpdate per chunk.
+        Returns None if the sheet already exists, so the caller can overwrite it instead.
+        """
+        try:
+            # Choose the new sheet's ID up front so the data write in the same batch can target it
+            sheet_id = zlib.crc32(sheet_name.encode('utf-8')) & 0x7fffffff
+            self._write_rows(spreadsheet_id, sheet_id, values, {
+                'addSheet': {
+                    'properties': {
+                        'sheetId': sheet_id,
+                        'title': sheet_name,
+                        'gridProperties': self._grid_properties(values)
+                    }
+                }
+            })
+            self._created_sheets[(spreadsheet_id, sheet_name)] = sheet_id
             
-            rows_updated = result.get('updatedRows', 0)
-            print(f"✅ Uploaded {rows_updated} rows to {sheet_name}")
+            # Remember the sheet so a rerun today overwrites it by ID instead of failing to add it again
+            remember_lookup(sheet_id, 'sheet', spreadsheet_id, sheet_name)
+            
+            logger.info("✅ Created new sheet: %s", sheet_name)
+            logger.info("✅ Uploaded %d rows to %s", len(values), sheet_name)
             return True
             
         except Exception as e:
-            print(f"❌ Error uploading data to {sheet_name}: {str(e)}")
+            if "already exists" in str(e).lower():
+                logger.info("📄 Sheet '%s' already exists", sheet_name)
+                return None
+            logger.error("❌ Error uploading data to %s: %s", sheet_name, e)
+            return False
+    
+    def rewrite_sheet(self, spreadsheet_id, sheet_id, sheet_name, values):
+        """Overwrite a sheet this uploader created earlier, resizing and clearing it in the same batchUpdate.
+        
+        Returns None if the sheet could not be written (e.g. it was deleted), so the caller can add it again.
+        """
+        try:
+            self._write_rows(spreadsheet_id, sheet_id, values, {
+                'updateSheetProperties': {
+                    'properties': {
+                        'sheetId': sheet_id,
+                        'gridProperties': self._grid_properties(values)
+                    },
+                    'fields': 'gridProperties(rowCount,columnCount)'
+                }
+            })
+            
+            logger.info("📄 Overwrote existing sheet: %s", sheet_name)
+            logger.info("✅ Uploaded %d rows to %s", len(values), sheet_name)
+            return True
+            
+        except Exception as e:
+            logger.warning("⚠️ Could not overwrite sheet %s by ID, adding it again: %s", sheet_name, e)
+            return None
+    
+    def upload_data_to_sheet(self, spreadsheet_id, sheet_name, values):
+        """Upload cleaned header + rows (from read_sheet_values) to a Google Sheet, UPLOAD_CHUNK_ROWS rows per request"""
+        try:
+            # Clear existing content first (only an existing sheet has any)
+            if (spreadsheet_id, sheet_name) not in self._created_sheets:
+                clear_range = f"{sheet_name}!A:Z"
+                execute(self.service.spreadsheets().values().clear(
+                    spreadsheetId=spreadsheet_id,
+                    range=clear_range
+                ))
+            
+            # Upload new data; each chunk goes to its own rows, so a retried request rewrites the same cells
+            rows_updated = 0
+            for start in range(0, len(values), UPLOAD_CHUNK_ROWS):
+                body = {
+                    'values': values[start:start + UPLOAD_CHUNK_ROWS]
+                }
+                
+                range_name = f"{sheet_name}!A{start + 1}"
+                result = self._execute_write(self.service.spreadsheets().values().update(
+                    spreadsheetId=spreadsheet_id,
+                    range=range_name,
+                    valueInputOption='RAW',
+                    body=body
+                ))
+                rows_updated += result.get('updatedRows', 0)
+            
+            logger.info("✅ Uploaded %d rows to %s", rows_updated, sheet_name)
+            return True
+            
+        except Exception as e:
+            logger.error("❌ Error uploading data to %s: %s", sheet_name, e)
             return False
     
     def find_call_request_files(self):
@@ -116,102 +289,112 @@ class CallRequestUploader:
         llm_outputs_dir = f"outputs/LLM_outputs/{date_folder}"
         
         if not os.path.exists(llm_outputs_dir):
-            print(f"⚠️ LLM outputs directory not found: {llm_outputs_dir}")
+            logger.warning("⚠️ LLM outputs directory not found: %s", llm_outputs_dir)
             return files
         
-        for filename in os.listdir(llm_outputs_dir):
-            if filename.startswith('call_request_') and filename.endswith('.csv'):
-                filepath = os.path.join(llm_outputs_dir, filename)
-                # Extract department from filename
-                dept_part = filename.replace('call_request_', '').replace('.csv', '')
-                # Remove date suffix (format: _MM_DD)
-                if '_' in dept_part:
-                    dept_key = '_'.join(dept_part.split('_')[:-2])
-                else:
-                    dept_key = dept_part
-                
+        # call_request_mv_resolvers_07_28.csv -> mv_resolvers
+        llm_outputs = scan_llm_outputs(date_folder, yesterday.strftime('%m_%d'))
+        for (prompt, dept_key), (filepath, filename) in llm_outputs.items():
+            if prompt == 'call_request':
                 files.append((filepath, dept_key, filename))
-                print(f"📁 Found call request file: {filename}")
+                logger.info("📁 Found call request file: %s", filename)
         
         return files
     
+    def _process_one(self, filepath, dept_key, filename, sheet_name, parsed=None):
+        """Read one department's call request file and upload it to its sheet; returns True on success.
+        
+        parsed is an optional future already reading the file in a worker process.
+        """
+        try:
+            # Create proper department name (MV Resolvers, CC Sales, ...)
+            dept_name = DEPARTMENT_NAMES.get(dept_key, dept_key.replace('_', ' ').title())
+            
+            logger.info("\n📤 Processing %s...", dept_name)
+            
+            # Check if we have a sheet for this department
+            if dept_key not in self.department_sheets:
+                logger.warning("⚠️ No Google Sheet configured for %s", dept_name)
+                logger.warning("   Available departments: %s", [DEPARTMENT_NAMES.get(key, key) for key in self.department_sheets])
+                return False
+            
+            spreadsheet_id = self.department_sheets[dept_key]
+            
+            # Read the data
+            values = parsed.result() if parsed else read_sheet_values(filepath)
+            logger.info("📊 Found %d records for %s", len(values) - 1, dept_name)
+            
+            if len(values) <= 1:
+                logger.warning("⚠️ No data to upload for %s", dept_name)
+                return False
+            
+            # A sheet this uploader created earlier today is overwritten by ID in one request
+            uploaded = None
+            sheet_id = get_cached_lookup('sheet', spreadsheet_id, sheet_name)
+            if sheet_id is not None:
+                uploaded = self.rewrite_sheet(spreadsheet_id, sheet_id, sheet_name, values)
+            
+            # Otherwise create the sheet and upload the data in one request
+            if uploaded is None:
+                uploaded = self.upload_via_batch(spreadsheet_id, sheet_name, values)
+            if uploaded is None:
+                # The sheet is left over from an earlier run, so clear and overwrite it
+                uploaded = self.upload_data_to_sheet(spreadsheet_id, sheet_name, values)
+            
+            if uploaded:
+                logger.info("✅ Successfully uploaded %s call request data", dept_name)
+                return True
+            logger.error("❌ Failed to upload %s data", dept_name)
+            return False
+                
+        except Exception as e:
+            logger.error("❌ Error processing %s: %s", filename, e)
+            return False
+    
     def process_all_files(self):
         """Process and upload all call request files"""
         try:
             if not self.service:
-                print("❌ Google Sheets API not available")
+                logger.error("❌ Google Sheets API not available")
                 return
             
             files = self.find_call_request_files()
             
             if not files:
-                print("ℹ️ No call request files found to upload")
+                logger.info("ℹ️ No call request files found to upload")
                 return
             
             yesterday = datetime.now() - timedelta(days=1)
             sheet_name = yesterday.strftime('%Y-%m-%d')
             
-            successful_uploads = 0
-            
-            for filepath, dept_key, filename in files:
-                try:
-                    # Create proper department name
-                    dept_name = dept_key.replace('_', ' ').title()
-                    
-                    # Handle specific department name mappings
-                    if dept_name == 'Mv Resolvers':
-                        dept_name = 'MV Resolvers'
-                    elif dept_name == 'Mv Sales':
-                        dept_name = 'MV Sales'
-                    elif dept_name == 'Cc Sales':
-                        dept_name = 'CC Sales'
-                    elif dept_name == 'Cc Resolvers':
-                        dept_name = 'CC Resolvers'
-                    
-                    print(f"\n📤 Processing {dept_name}...")
-                    
-                    # Check if we have a sheet for this department
-                    if dept_name not in self.department_sheets:
-                        print(f"⚠️ No Google Sheet configured for {dept_name}")
-                        print(f"   Available departments: {list(self.department_sheets.keys())}")
-                        continue
-                    
-                    spreadsheet_id = self.department_sheets[dept_name]
-                    
-                    # Read the data
-                    df = pd.read_csv(filepath)
-                    print(f"📊 Found {len(df)} records for {dept_name}")
-                    
-                    if len(df) == 0:
-                        print(f"⚠️ No data to upload for {dept_name}")
-                        continue
-                    
-                    # Create new sheet if needed
-                    if self.create_new_sheet(spreadsheet_id, sheet_name):
-                        # Upload the data
-                        if self.upload_data_to_sheet(spreadsheet_id, sheet_name, df):
-                            successful_uploads += 1
-                            print(f"✅ Successfully uploaded {dept_name} call request data")
-                        else:
-                            print(f"❌ Failed to upload {dept_name} data")
-                    else:
-                        print(f"❌ Failed to create/access sheet for {dept_name}")
-                        
-                except Exception as e:
-                    print(f"❌ Error processing {filename}: {str(e)}")
-                    continue
-            
-            print(f"\n📈 Upload Summary:")
-            print(f"✅ Successfully uploaded: {successful_uploads}/{len(files)} departments")
+            # Parsing is CPU-bound, so with several files to upload it runs in worker processes
+            # while the upload threads wait on the network; each upload picks up its rows when ready
+            to_parse = [filepath for filepath, dept_key, _ in files if dept_key in self.department_sheets]
+            parse_pool = (ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(to_parse)))
+                          if len(to_parse) > 1 else nullcontext())
+            with parse_pool as parsers:
+                parsed = {filepath: parsers.submit(read_sheet_values, filepath) for filepath in to_parse} if parsers else {}
+                
+                # Uploads wait on Sheets round-trips rather than the CPU, so run the departments concurrently
+                with ThreadPoolExecutor(max_workers=min(_MAX_WORKERS, len(files))) as executor:
+                    futures = [executor.submit(self._process_one, filepath, dept_key, filename, sheet_name,
+                                               parsed.get(filepath))
+                               for filepath, dept_key, filename in files]
+                    successful_uploads = sum(1 for future in as_completed(futures) if future.result())
+            
+            logger.info("\n📈 Upload Summary:")
+            logger.info("✅ Successfully uploaded: %d/%d departments", successful_uploads, len(files))
             
             if successful_uploads > 0:
-                print(f"📅 All data uploaded to sheets named: {sheet_name}")
+                logger.info("📅 All data uploaded to sheets named: %s", sheet_name)
             
         except Exception as e:
-            print(f"❌ Error in call request upload process: {str(e)}")
+            logger.error("❌ Error in call request upload process: %s", e)
 
 # For backwards compatibility and direct execution
 def main():
+    # Plain messages on stdout, like the other post-processors' prints
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
     uploader = CallRequestUploader()
     uploader.process_all_files()
 
@@ -8,16 +8,68 @@ Upload categorizing CSV files to Google Spreadsheets
 import pandas as pd
 import os
 import json
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+from post_processors._llm_outputs import read_llm_output_column
+from post_processors._sheets import TAB_FIELDS, execute, tab_row_counts
+from post_processors._sheets_base import SnapshotSheetProcessor
 
-class CategorizingUploader:
+# "InterventionOrTransfer": "Intervention" / "Transfer" (value in any case) in an LLM output
+_INTERVENTION_OR_TRANSFER_RE = re.compile(r'"InterventionOrTransfer"\s*:\s*"((?i:intervention|transfer))"')
+
+# Departments with categorizing sheets, keyed like the filenames, including the spellings and
+# prompt-prefixed keys seen in filenames (for now only MV Resolvers is supported)
+CATEGORIZING_DEPARTMENTS = {
+    'mv_resolvers': 'MV Resolvers',
+    'mvresolvers': 'MV Resolvers',
+    'mv-resolvers': 'MV Resolvers',
+    'mvr_mv_resolvers': 'MV Resolvers',
+}
+
+# Upper bound on departments prepared concurrently
+_MAX_WORKERS = 8
+
+# Cell values longer than this are truncated to stay clear of Google Sheets limits
+CELL_CHAR_LIMIT = 30000
+
+# Cell text sent per values.batchUpdate, keeping each request well under the Sheets request size limit
+UPLOAD_CHUNK_CHARS = 5_000_000
+
+
+def read_sheet_csv(filepath):
+    """Read a CSV as text for upload, with empty cells as "" instead of NaN"""
+    return pd.read_csv(filepath, dtype=str, keep_default_na=False)
+
+
+def upload_batches(tabs):
+    """Split {sheet_name: rows} into values.batchUpdate data lists of at most UPLOAD_CHUNK_CHARS cell characters.
+    
+    Small tabs share a request; a large tab is split across requests at row boundaries.
+    """
+    batches = [[]]
+    batch_chars = 0
+    for sheet_name, data in tabs.items():
+        start = 0
+        for i, row in enumerate(data):
+            row_chars = sum(len(str(cell)) for cell in row)
+            # Start a new request once this row would overflow the current one (unless it is still empty)
+            if batch_chars + row_chars > UPLOAD_CHUNK_CHARS and (i > start or batches[-1]):
+                if i > start:
+                    batches[-1].append({'range': f"{sheet_name}!A{start + 1}", 'values': data[start:i]})
+                    start = i
+                batches.append([])
+                batch_chars = 0
+            batch_chars += row_chars
+        if start < len(data):
+            batches[-1].append({'range': f"{sheet_name}!A{start + 1}", 'values': data[start:]})
+    return [batch for batch in batches if batch]
+
+
+class CategorizingUploader(SnapshotSheetProcessor):
     def __init__(self, credentials_path='credentials.json'):
         """Initialize Categorizing Uploader with Google Sheets integration"""
-        self.credentials_path = credentials_path
-        self.service = None
-        self.setup_sheets_api()
+        super().__init__(credentials_path)
         
         # Main categorizing sheet ID
         self.categorizing_sheet_id = '1hJUaSX75lgtKY8tnqzWVXF7MXUBGhlltTiHBu_xSM10'
@@ -25,25 +77,6 @@ class CategorizingUploader:
         # Snapshot sheet ID (where we update % Transfer and % Intervention)
         self.snapshot_sheet_id = '1XkVcHlkh8fEp7mmBD1Zkavdp2blBLwSABT1dE_sOf74'
 
-    def setup_sheets_api(self):
-        """Setup Google Sheets API authentication"""
-        try:
-            SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
-            
-            if os.path.exists(self.credentials_path):
-                creds = Credentials.from_service_account_file(
-                    self.credentials_path, scopes=SCOPES)
-                self.service = build('sheets', 'v4', credentials=creds)
-                print("✅ Google Sheets API authenticated successfully")
-                return True
-            else:
-                print(f"❌ Credentials file not found: {self.credentials_path}")
-                return False
-                
-        except Exception as e:
-            print(f"❌ Error setting up Google Sheets API: {str(e)}")
-            return False
-
     def find_categorizing_files(self):
         """Find categorizing files and their corresponding reports"""
         # Look in yesterday's date subfolder
@@ -112,15 +145,13 @@ class CategorizingUploader:
         return file_pairs
 
     def convert_dept_key_to_name(self, dept_key):
-        """Convert department key to proper department name"""
-        # Handle MV Resolvers
-        if 'mv' in dept_key.lower() and 'resolvers' in dept_key.lower():
-            return 'MV Resolvers'
-        elif 'mv_resolvers' == dept_key.lower():
-            return 'MV Resolvers'
-        
-        # For now, since only MV Resolvers is supported, return None for others
-        return None
+        """Convert department key to proper department name (None for departments without categorizing sheets)"""
+        key = dept_key.lower().replace(' ', '_')
+        department = CATEGORIZING_DEPARTMENTS.get(key)
+        # Any other key naming both parts is still MV Resolvers
+        if department is None and 'mv' in key and 'resolvers' in key:
+            department = 'MV Resolvers'
+        return department
 
     def create_sheet_name(self, date_str, is_raw=False):
         """Create properly formatted sheet name: yyyy-mm-dd or yyyy-mm-dd-RAW"""
@@ -137,147 +168,139 @@ class CategorizingUploader:
         except:
             return f"{date_str}-RAW" if is_raw else date_str
 
-    def create_new_sheet(self, spreadsheet_id, sheet_name):
-        """Create a new sheet in the target spreadsheet"""
+    def sheet_values(self, filepath, df=None):
+        """Read (unless df is given) and clean a CSV for upload; returns the header + rows.
+        
+        df is the file already read with read_sheet_csv(); it is cleaned in place.
+        """
+        # Read CSV file unless the caller already has it
+        if df is None:
+            df = read_sheet_csv(filepath)
+        print(f"📊 Read {len(df)} rows from {os.path.basename(filepath)}")
+        
+        # Clean the data for Google Sheets API column by column with pandas string methods
+        for column in df.columns:
+            cells = df[column]
+            # Keep linebreaks but normalize them to \n for Google Sheets
+            cells = cells.str.replace('\r\n', '\n', regex=False).str.replace('\r', '\n', regex=False)
+            # Use safe limit to avoid Google Sheets issues
+            too_long = cells.str.len() > CELL_CHAR_LIMIT
+            if too_long.any():
+                cells = cells.mask(too_long, cells.str.slice(0, CELL_CHAR_LIMIT) + "...[TRUNCATED]")
+            df[column] = cells
+        
+        # Combine headers with data
+        headers = [str(col) for col in df.columns.tolist()]
+        data = [headers]
+        data.extend(df.values.tolist())
+        return data
+
+    def upload_tabs(self, spreadsheet_id, tabs):
+        """Replace the contents of several tabs, creating the missing ones, with a handful of batched API calls.
+        
+        tabs maps each sheet name to its header + rows from sheet_values().
+        """
         if not self.service:
             print("❌ Google Sheets service not available")
             return False
             
         try:
-            request_body = {
-                'requests': [{
-                    'addSheet': {
-                        'properties': {
-                            'title': sheet_name
-                        }
+            # Which tabs exist already
+            existing = tab_row_counts(execute(self.service.spreadsheets().get(
+                spreadsheetId=spreadsheet_id, fields=TAB_FIELDS)))
+            
+            # Add all the missing tabs in one batchUpdate
+            missing = [sheet_name for sheet_name in tabs if sheet_name not in existing]
+            if missing:
+                execute(self.service.spreadsheets().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body={'requests': [{'addSheet': {'properties': {'title': sheet_name}}} for sheet_name in missing]}
+                ))
+                for sheet_name in missing:
+                    print(f"✅ Created new sheet: {sheet_name}")
+            
+            # Clear the tabs that already existed in one batchClear (new tabs are empty)
+            stale = [sheet_name for sheet_name in tabs if sheet_name in existing]
+            if stale:
+                for sheet_name in stale:
+                    print(f"📋 Sheet already exists: {sheet_name}")
+                execute(self.service.spreadsheets().values().batchClear(
+                    spreadsheetId=spreadsheet_id,
+                    body={'ranges': [f"{sheet_name}!A:Z" for sheet_name in stale]}
+                ))
+            
+            # Upload the tabs' data in as few values.batchUpdate calls as the request size limit allows
+            for data in upload_batches(tabs):
+                execute(self.service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body={
+                        'valueInputOption': 'RAW',
+                        'data': data
                     }
-                }]
-            }
-            
-            response = self.service.spreadsheets().batchUpdate(
-                spreadsheetId=spreadsheet_id,
-                body=request_body
-            ).execute()
+                ))
             
-            print(f"✅ Created new sheet: {sheet_name}")
+            for sheet_name, data in tabs.items():
+                print(f"✅ Uploaded {len(data)} rows to sheet: {sheet_name}")
             return True
             
         except Exception as e:
-            if "already exists" in str(e):
-                print(f"📋 Sheet already exists: {sheet_name}")
-                return True
-            else:
-                print(f"❌ Error creating sheet {sheet_name}: {str(e)}")
-                return False
-
-    def upload_data_to_sheet(self, filepath, spreadsheet_id, sheet_name, is_report=False):
-        """Upload CSV data to the specified sheet"""
-        if not self.service:
-            print("❌ Google Sheets service not available")
+            print(f"❌ Error uploading to {', '.join(tabs)}: {str(e)}")
             return False
-            
+
+    @staticmethod
+    def parse_intervention_or_transfer(llm_output):
+        """Parse one LLM output's JSON and return its lowercased InterventionOrTransfer label (None if invalid)"""
         try:
-            # Read CSV file
-            df = pd.read_csv(filepath)
-            print(f"📊 Read {len(df)} rows from {os.path.basename(filepath)}")
-            
-            # Clean the data for Google Sheets API
-            def clean_cell_value(value):
-                """Clean cell values to prevent JSON parsing errors while preserving linebreaks"""
-                if pd.isna(value):
-                    return ""
-                value_str = str(value)
-                # Keep linebreaks but normalize them to \n for Google Sheets
-                value_str = value_str.replace('\r\n', '\n').replace('\r', '\n')
-                # Use safe limit to avoid Google Sheets issues
-                if len(value_str) > 30000:
-                    value_str = value_str[:30000] + "...[TRUNCATED]"
-                return value_str
-            
-            # Convert DataFrame to list of lists with cleaned values
-            headers = [str(col) for col in df.columns.tolist()]
-            
-            cleaned_data = []
-            for _, row in df.iterrows():
-                cleaned_row = [clean_cell_value(value) for value in row]
-                cleaned_data.append(cleaned_row)
-            
-            # Combine headers with data
-            data = [headers]
-            data.extend(cleaned_data)
-            
-            # Clear existing data and upload new data
-            range_name = f"{sheet_name}!A:Z"
-            
-            # Clear the sheet first
-            self.service.spreadsheets().values().clear(
-                spreadsheetId=spreadsheet_id,
-                range=range_name
-            ).execute()
-            
-            # Upload new data
-            body = {
-                'values': data
-            }
-            
-            result = self.service.spreadsheets().values().update(
-                spreadsheetId=spreadsheet_id,
-                range=f"{sheet_name}!A1",
-                valueInputOption='RAW',
-                body=body
-            ).execute()
-            
-            data_type = "report" if is_report else "raw data"
-            print(f"✅ Uploaded {len(data)} rows of {data_type} to sheet: {sheet_name}")
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error uploading to {sheet_name}: {str(e)}")
-            return False
+            # Clean and parse JSON
+            cleaned = str(llm_output).strip()
+            if cleaned.startswith('```json'):
+                cleaned = cleaned.replace('```json', '').replace('```', '').strip()
+            elif cleaned.startswith('```'):
+                cleaned = cleaned.replace('```', '').strip()
+            
+            parsed = json.loads(cleaned)
+            intervention_or_transfer = parsed.get('InterventionOrTransfer', '').lower()
+            
+            if intervention_or_transfer in ['intervention', 'transfer']:
+                return intervention_or_transfer
+            return None
+                
+        except (json.JSONDecodeError, Exception):
+            return None
 
-    def calculate_overall_percentages(self, raw_file):
-        """Calculate overall % Transfer and % Intervention from raw data"""
+    def calculate_overall_percentages(self, raw_file, raw_df=None):
+        """Calculate overall % Transfer and % Intervention from raw data (raw_df if already read)"""
         try:
-            df = pd.read_csv(raw_file)
-            print(f"📊 Calculating overall percentages from {len(df)} conversations")
+            if raw_df is not None:
+                outputs = raw_df['llm_output'] if 'llm_output' in raw_df.columns else None
+            else:
+                # Only the llm_output column is needed, so the transcripts in the other columns are not parsed
+                outputs = read_llm_output_column(raw_file)
+            if outputs is None:
+                print("⚠️  No valid intervention/transfer data found (no llm_output column)")
+                return None, None
+            total_conversations = len(outputs)
+            print(f"📊 Calculating overall percentages from {total_conversations} conversations")
             
-            # Parse JSON outputs to get intervention/transfer data
-            intervention_count = 0
-            transfer_count = 0
-            total_parsed = 0
+            # Read the InterventionOrTransfer label of every output with one regex pass, and
+            # fully parse only the outputs it misses that still mention the key
+            outputs = outputs.dropna().astype(str)
+            outputs = outputs[outputs.str.strip() != '']
             
-            for _, row in df.iterrows():
-                llm_output = row.get('llm_output', '')
-                if pd.isna(llm_output) or not llm_output.strip():
-                    continue
-                
-                try:
-                    # Clean and parse JSON
-                    cleaned = str(llm_output).strip()
-                    if cleaned.startswith('```json'):
-                        cleaned = cleaned.replace('```json', '').replace('```', '').strip()
-                    elif cleaned.startswith('```'):
-                        cleaned = cleaned.replace('```', '').strip()
-                    
-                    parsed = json.loads(cleaned)
-                    intervention_or_transfer = parsed.get('InterventionOrTransfer', '').lower()
-                    
-                    if intervention_or_transfer in ['intervention', 'transfer']:
-                        total_parsed += 1
-                        if intervention_or_transfer == 'intervention':
-                            intervention_count += 1
-                        elif intervention_or_transfer == 'transfer':
-                            transfer_count += 1
-                            
-                except (json.JSONDecodeError, Exception):
-                    continue
+            labels = outputs.str.extract(_INTERVENTION_OR_TRANSFER_RE, expand=False).str.lower()
+            missed = labels.isna() & outputs.str.contains('"InterventionOrTransfer"', regex=False)
+            if missed.any():
+                labels[missed] = outputs[missed].astype(object).map(self.parse_intervention_or_transfer)
+            
+            intervention_count = int((labels == 'intervention').sum())
+            transfer_count = int((labels == 'transfer').sum())
+            total_parsed = intervention_count + transfer_count
             
             if total_parsed == 0:
                 print("⚠️  No valid intervention/transfer data found")
                 return None, None
             
             # Calculate percentages based on total conversations (not just parsed ones)
-            total_conversations = len(df)
             pct_intervention = (intervention_count / total_conversations) * 100
             pct_transfer = (transfer_count / total_conversations) * 100
             
@@ -293,131 +316,28 @@ class CategorizingUploader:
             print(f"❌ Error calculating percentages: {str(e)}")
             return None, None
 
-    def find_column_by_name(self, sheet_id, column_name, sheet_name='Data'):
-        """Find column number by searching for column name in header row"""
-        if not self.service:
-            return None, None
-            
-        sheet_names_to_try = ['Data', 'Sheet1', 'Main']
-        
-        for current_sheet_name in sheet_names_to_try:
-            try:
-                # Get the first row (headers)
-                range_name = f"{current_sheet_name}!1:1"
-                result = self.service.spreadsheets().values().get(
-                    spreadsheetId=sheet_id, range=range_name).execute()
-                
-                values = result.get('values', [])
-                if values and len(values[0]) > 0:
-                    headers = values[0]
-                    print(f"🔍 Searching for column '{column_name}' in sheet '{current_sheet_name}'...")
-                    
-                    # First try exact match
-                    for i, header in enumerate(headers):
-                        if header:
-                            header_clean = str(header).strip()
-                            if header_clean == column_name:
-                                print(f"📍 Found exact match for '{column_name}' at column {i+1} of sheet {current_sheet_name}")
-                                return i + 1, current_sheet_name  # 1-based column number
-                    
-                    # Then try case-insensitive exact match
-                    for i, header in enumerate(headers):
-                        if header:
-                            header_clean = str(header).strip()
-                            if header_clean.lower() == column_name.lower():
-                                print(f"📍 Found case-insensitive match for '{column_name}' at column {i+1} of sheet {current_sheet_name}")
-                                return i + 1, current_sheet_name  # 1-based column number
-                            
-            except Exception as e:
-                continue
-        
-        print(f"❌ Column '{column_name}' not found in any sheet")
-        return None, None
-
-    def find_date_row(self, sheet_id, target_date, sheet_name='Data'):
-        """Find row with target date (yyyy-mm-dd format) in column A"""
-        if not self.service:
-            return None, None
-            
-        try:
-            # Get all data from column A
-            range_name = f"{sheet_name}!A:A"
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=sheet_id, range=range_name).execute()
-            
-            values = result.get('values', [])
-            
-            # Find the row with target date
-            for i, row in enumerate(values):
-                if row and len(row) > 0:
-                    cell_value = str(row[0]).strip()
-                    if target_date in cell_value:
-                        print(f"✅ Found date {target_date} in row {i+1}")
-                        return i + 1, sheet_name
-            
-            print(f"❌ Date {target_date} not found")
-            return None, None
-            
-        except Exception as e:
-            print(f"❌ Error finding date row: {str(e)}")
-            return None, None
-
-    def update_cell_value(self, sheet_id, sheet_name, row, col, value):
-        """Update a specific cell with the percentage value"""
-        if not self.service:
-            return False
-            
-        try:
-            # Convert column number to letter
-            if col <= 26:
-                col_letter = chr(64 + col)  # A-Z
-            else:
-                first_letter = chr(64 + ((col - 1) // 26))
-                second_letter = chr(64 + ((col - 1) % 26) + 1)
-                col_letter = first_letter + second_letter
-                
-            range_name = f"{sheet_name}!{col_letter}{row}"
-            
-            # Update the cell
-            body = {
-                'values': [[value]]
-            }
-            
-            result = self.service.spreadsheets().values().update(
-                spreadsheetId=sheet_id,
-                range=range_name,
-                valueInputOption='RAW',
-                body=body
-            ).execute()
-            
-            print(f"✅ Updated {range_name} with: {value}")
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error updating cell: {str(e)}")
-            return False
-
     def update_snapshot_sheet(self, pct_intervention, pct_transfer):
         """Update the snapshot sheet with overall percentages"""
         print(f"\n📊 Updating snapshot sheet with overall percentages...")
         
         # Find yesterday's date in yyyy-mm-dd format
-        yesterday_date = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        yesterday = datetime.now() - timedelta(days=1)
         
-        # Find the date row
-        date_row, sheet_name = self.find_date_row(self.snapshot_sheet_id, yesterday_date)
+        # Find the date row: a cached row is checked against column A, then the tail of column A
+        # read with the header row is searched, then the whole column
+        date_row, sheet_name = self.find_date_row(yesterday)
         if not date_row:
-            print(f"❌ Could not find date {yesterday_date} in snapshot sheet")
+            print(f"❌ Could not find date {yesterday.strftime('%Y-%m-%d')} in snapshot sheet")
             return False
         
         # Find % Intervention column
-        intervention_col, sheet_name = self.find_column_by_name(self.snapshot_sheet_id, '% Intervention', sheet_name)
+        intervention_col = self.find_column_by_name('% Intervention', sheet_name)
         if not intervention_col:
             print("❌ Could not find '% Intervention' column")
             return False
         
         # Find % Transfer column  
-        transfer_col, sheet_name = self.find_column_by_name(self.snapshot_sheet_id, '% Transfer', sheet_name)
+        transfer_col = self.find_column_by_name('% Transfer', sheet_name)
         if not transfer_col:
             print("❌ Could not find '% Transfer' column")
             return False
@@ -425,11 +345,11 @@ class CategorizingUploader:
         # Update both cells
         intervention_value = f"{pct_intervention:.2f}%"
         transfer_value = f"{pct_transfer:.2f}%"
+        self.update_cell_value(f"{sheet_name}!{intervention_col}{date_row}", intervention_value)
+        self.update_cell_value(f"{sheet_name}!{transfer_col}{date_row}", transfer_value)
         
-        success = True
-        success &= self.update_cell_value(self.snapshot_sheet_id, sheet_name, date_row, intervention_col, intervention_value)
-        success &= self.update_cell_value(self.snapshot_sheet_id, sheet_name, date_row, transfer_col, transfer_value)
-        
+        # USER_ENTERED stores "12.34%" as the number 0.1234 in percent format rather than as text
+        success = self.snapshot_sheet_id in self.flush_writes(value_input_option='USER_ENTERED')
         if success:
             print(f"✅ Successfully updated snapshot sheet:")
             print(f"   % Intervention: {intervention_value}")
@@ -437,6 +357,42 @@ class CategorizingUploader:
         
         return success
 
+    def _prepare_department(self, file_data):
+        """Read one department's files, calculate its percentages and clean its tabs for upload.
+        
+        Returns (department, {sheet_name: data}, pct_intervention, pct_transfer), or None on error.
+        """
+        department = file_data['department']
+        raw_file = file_data['raw_file']
+        report_file = file_data['report_file']
+        date_str = file_data['date_str']
+        
+        try:
+            # Create sheet names
+            report_sheet_name = self.create_sheet_name(date_str, is_raw=False)
+            raw_sheet_name = self.create_sheet_name(date_str, is_raw=True)
+            
+            print(f"\n📊 Processing {department}:")
+            print(f"  📋 Report: {os.path.basename(report_file)} -> {report_sheet_name}")
+            print(f"  📄 Raw: {os.path.basename(raw_file)} -> {raw_sheet_name}")
+            
+            # Read the raw data once for both the percentages and the upload
+            raw_df = read_sheet_csv(raw_file)
+            
+            # Calculate overall percentages from raw data (before the upload cleans and truncates it)
+            pct_intervention, pct_transfer = self.calculate_overall_percentages(raw_file, raw_df)
+            
+            # Prepare the report and raw data tabs
+            tabs = {
+                report_sheet_name: self.sheet_values(report_file),
+                raw_sheet_name: self.sheet_values(raw_file, raw_df)
+            }
+            return department, tabs, pct_intervention, pct_transfer
+                
+        except Exception as e:
+            print(f"❌ Error processing {department}: {str(e)}")
+            return None
+
     def process_all_files(self):
         """Process all categorizing files and upload to Google Sheets"""
         if not self.service:
@@ -454,59 +410,40 @@ class CategorizingUploader:
         
         print(f"📁 Found {len(file_pairs)} department file pairs to upload")
         
-        success_count = 0
+        # Read, score and clean the departments' files concurrently; map keeps the file order
+        with ThreadPoolExecutor(max_workers=min(_MAX_WORKERS, len(file_pairs))) as executor:
+            prepared = [result for result in executor.map(self._prepare_department, file_pairs) if result]
+        
+        # Every department's report and raw tabs, uploaded together below
+        tabs = {}
         overall_intervention_pct = None
         overall_transfer_pct = None
+        for _, department_tabs, pct_intervention, pct_transfer in prepared:
+            tabs.update(department_tabs)
+            if pct_intervention is not None and pct_transfer is not None:
+                overall_intervention_pct = pct_intervention
+                overall_transfer_pct = pct_transfer
+        update_snapshot = overall_intervention_pct is not None and overall_transfer_pct is not None
         
-        for file_data in file_pairs:
-            department = file_data['department']
-            raw_file = file_data['raw_file']
-            report_file = file_data['report_file']
-            date_str = file_data['date_str']
-            
-            try:
-                # Create sheet names
-                report_sheet_name = self.create_sheet_name(date_str, is_raw=False)
-                raw_sheet_name = self.create_sheet_name(date_str, is_raw=True)
-                
-                print(f"\n📊 Processing {department}:")
-                print(f"  📋 Report: {os.path.basename(report_file)} -> {report_sheet_name}")
-                print(f"  📄 Raw: {os.path.basename(raw_file)} -> {raw_sheet_name}")
-                
-                success = True
-                
-                # Create and upload report sheet
-                if self.create_new_sheet(self.categorizing_sheet_id, report_sheet_name):
-                    if not self.upload_data_to_sheet(report_file, self.categorizing_sheet_id, report_sheet_name, is_report=True):
-                        success = False
-                else:
-                    success = False
-                
-                # Create and upload raw data sheet
-                if self.create_new_sheet(self.categorizing_sheet_id, raw_sheet_name):
-                    if not self.upload_data_to_sheet(raw_file, self.categorizing_sheet_id, raw_sheet_name, is_report=False):
-                        success = False
-                else:
-                    success = False
-                
-                # Calculate overall percentages from raw data
-                pct_intervention, pct_transfer = self.calculate_overall_percentages(raw_file)
-                if pct_intervention is not None and pct_transfer is not None:
-                    overall_intervention_pct = pct_intervention
-                    overall_transfer_pct = pct_transfer
-                
-                if success:
-                    success_count += 1
-                    print(f"✅ Successfully uploaded {department} data")
-                    print(f"📋 Spreadsheet URL: https://docs.google.com/spreadsheets/d/{self.categorizing_sheet_id}")
-                else:
-                    print(f"❌ Failed to upload {department} data")
-                    
-            except Exception as e:
-                print(f"❌ Error processing {department}: {str(e)}")
+        # Create, clear and fill all the tabs with a handful of batched API calls instead of 3 per tab,
+        # while the snapshot sheet's header and dates are read on another connection
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            upload = executor.submit(self.upload_tabs, self.categorizing_sheet_id, tabs) if tabs else None
+            if update_snapshot:
+                executor.submit(self.fetch_sheet_context, self.snapshot_sheet_id, 'Data')
+        uploaded = upload is not None and upload.result()
+        
+        for department, _, _, _ in prepared:
+            if uploaded:
+                print(f"✅ Successfully uploaded {department} data")
+            else:
+                print(f"❌ Failed to upload {department} data")
+        success_count = len(prepared) if uploaded else 0
+        if uploaded:
+            print(f"📋 Spreadsheet URL: https://docs.google.com/spreadsheets/d/{self.categorizing_sheet_id}")
         
-        # Update snapshot sheet with overall percentages
-        if overall_intervention_pct is not None and overall_transfer_pct is not None:
+        # Update snapshot sheet with overall percentages (its reads are cached by now)
+        if update_snapshot:
             self.update_snapshot_sheet(overall_intervention_pct, overall_transfer_pct)
         
         # Print summary
@@ -10,6 +10,7 @@ Implements the complete pipeline flow:
 """
 
 import argparse
+import logging
 import sys
 import os
 import pandas as pd
@@ -1255,6 +1256,9 @@ def run_sentiment_analysis(departments, model, format_type, with_upload=False, d
                 else:
                     results[department] = None
             
+            # Write every queued cell update
+            processor.flush_writes()
+            
             # Print summary for requested departments only
             print(f"\n📈 Summary: Processed {success_count}/{len(dept_list)} departments")
             print("\n📊 NPS Results:")
@@ -1357,81 +1361,11 @@ def run_rule_breaking(departments, model, format_type, with_upload=False, dry_ru
             from post_processors.upload_rulebreaking_sheets import RuleBreakingUploader
             
             # Only process the departments that were specified
-            processor = RuleBreakingProcessor()
+            processor = RuleBreakingProcessor(run_date=target_date)
             print(f"🚀 Starting Rule Breaking post-processing for: {', '.join(dept_list)}")
             
-            # Find rule breaking files for the specified departments only
-            all_files = processor.find_rule_breaking_files()
-            
-            # Filter files to only include requested departments
-            filtered_files = []
-            for filepath, dept_key, filename in all_files:
-                # Convert dept_key to proper department name to match dept_list
-                dept_name = dept_key.replace('_', ' ').title()
-                
-                # Handle specific mappings
-                if dept_name == 'Cc Sales':
-                    dept_name = 'CC Sales'
-                elif dept_name == 'Cc Resolvers':
-                    dept_name = 'CC Resolvers'
-                elif dept_name == 'Mv Resolvers':
-                    dept_name = 'MV Resolvers'
-                elif dept_name == 'Mv Sales':
-                    dept_name = 'MV Sales'
-                
-                if dept_name in dept_list:
-                    filtered_files.append((filepath, dept_key, filename))
-                    print(f"📁 Will process: {filename} -> {dept_name}")
-                else:
-                    print(f"⏭️  Skipping: {filename} -> {dept_name} (not in requested departments)")
-            
-            # Process only the filtered files
-            success_count = 0
-            for filepath, dept_key, filename in filtered_files:
-                try:
-                    print(f"\n📊 Processing {filename}...")
-                    
-                    # Analyze the data
-                    analysis_results = processor.analyze_rule_breaking_data(filepath)
-                    if not analysis_results:
-                        continue
-                    
-                    # Create proper department name (same logic as in original code)
-                    dept_name = dept_key.replace('_', ' ').title()
-                    
-                    # Map prompt prefixes and standard cases
-                    if dept_name == 'Mvr Mv Resolvers':
-                        dept_name = 'MV Resolvers'
-                    elif dept_name == 'Ccs Cc Sales':
-                        dept_name = 'CC Sales'
-                    elif dept_name == 'Mvs Mv Sales':
-                        dept_name = 'MV Sales'
-                    elif dept_name == 'Doc Doctors':
-                        dept_name = 'Doctors'
-                    elif dept_name == 'Cc Sales':
-                        dept_name = 'CC Sales'
-                    elif dept_name == 'Cc Resolvers':
-                        dept_name = 'CC Resolvers'
-                    elif dept_name == 'Mv Resolvers':
-                        dept_name = 'MV Resolvers'
-                    elif dept_name == 'Mv Sales':
-                        dept_name = 'MV Sales'
-                    
-                    # Create summary report
-                    output_filename = f"{processor.rule_breaking_dir}/{dept_name}_Rule_Breaking_Summary.csv"
-                    percentage_ge_1 = processor.create_summary_report(analysis_results, dept_name, output_filename)
-                    
-                    if percentage_ge_1 is not None:
-                        # Upload to Google Sheets
-                        if processor.upload_to_google_sheets(dept_name, percentage_ge_1):
-                            success_count += 1
-                        
-                except Exception as e:
-                    print(f"❌ Error processing {filename}: {str(e)}")
-            
-            # Print summary for requested departments only
-            print(f"\n📈 Processing Summary:")
-            print(f"✅ Successfully processed and uploaded: {success_count}/{len(filtered_files)} departments")
+            # Parse the requested departments' files in parallel and write their percentages in one batch per sheet
+            processor.process_all_departments(dept_list)
             
             # Upload files (this will only upload files that exist for requested departments)
             uploader = RuleBreakingUploader()
@@ -3011,6 +2945,10 @@ def parse_date(date_str: str) -> datetime:
 
 def main():
     """Main entry point"""
+    # Post-processors that log progress print plain messages on stdout; other libraries stay at warnings
+    logging.basicConfig(format='%(message)s', stream=sys.stdout)
+    logging.getLogger('post_processors').setLevel(logging.INFO)
+    
     parser = argparse.ArgumentParser(description='LLM-as-a-Judge Pipeline')
     parser.add_argument('--prompt', required=True, 
                        choices=['sentiment_analysis', 'rule_breaking', 'ftr', 'false_promises', 'categorizing', 'policy_escalation', 'client_suspecting_ai', 'clarity_score', 'legal_alignment', 'call_request', 'threatening', 'misprescription', 'unnecessary_clinic_rec', 'loss_of_interest', 'tool_calling'],
@@ -189,7 +189,13 @@ async def run_post_processing_and_upload():
                 results[department] = None
                 print(f"   ⚠️  {department}: No data found")
         
+        # Write every queued cell update; a department counts as uploaded once its sheet is written
+        flushed_sheet_ids = processor.flush_writes()
+        uploaded_count = sum(1 for department, nps in results.items()
+                             if nps is not None and processor.department_sheets.get(department) in flushed_sheet_ids)
+        
         print(f"\n📈 Processed {success_count}/{len(dept_list)} departments")
+        print(f"📤 Updated the snapshot sheets of {uploaded_count}/{success_count} departments")
         
         # Upload to Google Sheets
         print("\n📤 Uploading to Google Sheets...")
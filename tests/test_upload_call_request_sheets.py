@@ -0,0 +1,98 @@
+"""
+Tests for the gzipped request bodies of the call request uploader
+"""
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip('googleapiclient')
+httplib2 = pytest.importorskip('httplib2')
+
+from googleapiclient.http import HttpRequest
+
+import post_processors.upload_call_request_sheets as uploader
+
+
+class RecordingHttp:
+    """httplib2.Http stand-in that records each request and answers with the given statuses in turn"""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.requests = []
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        self.requests.append({'body': body, 'headers': dict(headers)})
+        return httplib2.Response({'status': self.statuses.pop(0)}), b'{}'
+
+
+def make_request(http, payload):
+    """Build a Sheets-style JSON POST request"""
+    body = json.dumps(payload)
+    return HttpRequest(http, lambda resp, content: json.loads(content),
+                       'https://sheets.googleapis.com/v4/spreadsheets/test:batchUpdate',
+                       method='POST', body=body, headers={'content-type': 'application/json'})
+
+
+@pytest.fixture(autouse=True)
+def execute_on_request_http(monkeypatch):
+    """Send requests through their own (recording) http object instead of a per-thread credentialed one"""
+    monkeypatch.setattr(uploader, 'execute', lambda request: request.execute())
+
+
+def large_payload():
+    return {'values': [['conversation text ' * 20] * 5] * 50}
+
+
+def test_gzip_body_sets_headers_and_round_trips():
+    payload = large_payload()
+    http = RecordingHttp(200)
+    request = make_request(http, payload)
+
+    uploader.execute_gzipped(request)
+
+    sent = http.requests[0]
+    assert sent['headers']['content-encoding'] == 'gzip'
+    assert sent['headers']['content-type'] == 'application/json'
+    assert int(sent['headers']['content-length']) == len(sent['body'])
+    assert len(sent['body']) < len(json.dumps(payload))
+    assert json.loads(gzip.decompress(sent['body'])) == payload
+
+
+def test_small_body_is_sent_uncompressed():
+    payload = {'values': [['a']]}
+    http = RecordingHttp(200)
+
+    uploader.execute_gzipped(make_request(http, payload))
+
+    sent = http.requests[0]
+    assert 'content-encoding' not in sent['headers']
+    assert json.loads(sent['body']) == payload
+
+
+@pytest.mark.parametrize('status', uploader.GZIP_REJECTED_STATUSES)
+def test_rejected_gzip_body_is_resent_uncompressed(status):
+    payload = large_payload()
+    http = RecordingHttp(status, 200)
+
+    uploader.execute_gzipped(make_request(http, payload))
+
+    assert len(http.requests) == 2
+    resent = http.requests[1]
+    assert 'content-encoding' not in resent['headers']
+    assert int(resent['headers']['content-length']) == len(resent['body'])
+    assert json.loads(resent['body']) == payload
+
+
+def test_other_errors_are_not_resent():
+    http = RecordingHttp(403)
+
+    with pytest.raises(uploader.HttpError):
+        uploader.execute_gzipped(make_request(http, large_payload()))
+    assert len(http.requests) == 1
+
+
+def test_gzip_uploads_are_off_by_default(tmp_path):
+    # A missing credentials file only leaves the Sheets service unset
+    instance = uploader.CallRequestUploader(str(tmp_path / 'credentials.json'))
+    assert instance.gzip_uploads is False